@@ -1,16 +1,43 @@
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import chromadb
-from chromadb.config import Settings
-import pdfplumber
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 import re
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Iterator, Tuple
+import hashlib
 import json
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import groupby
+import numpy as np
 from openai import OpenAI
+from bm25_index import BM25Index, BM25IndexHandle, build_bm25_index, read_bm25_generation
+from caching import LRUCache, SingleFlight
+from chroma_client import CollectionHandle
+from chunk_store import ChunkStoreWriter, open_chunk_store, prune_chunk_stores
+from compose_jobs import FINISHED, ComposeJobQueue
+from compose_reduce import reduce_draft
+from embeddings_helper import QueryEmbedder, get_embedding_function, normalize_query
+from extraction_cache import (
+    EXTRACTION_CACHE_MAX_BYTES, EXTRACTION_CACHE_PATH, ExtractionCache, extraction_cache_key
+)
+from index_writer import BatchedIndexWriter, INGEST_BATCH_SIZE
+from ingest_job import IngestJob
+from ingest_manifest import load_manifest, save_manifest, fingerprint_pdf, plan_ingestion, read_generation
+from page_chunker import iter_page_chunks
+from redis_support import RedisConnection
+from retrieval import StageTimings, chroma_where, is_exact_term_query, reciprocal_rank_fusion
+from token_budget import COMPOSE_TOKEN_BUDGET, format_excerpts, pack_excerpts, token_counter
+from structured_extraction import (
+    FACTS_VERSION, chunk_facts, facts_from_metadata, facts_to_metadata, merge_chunk_facts
+)
+import text_cache
+from text_cache import iter_cached_book_pages
+from tiered_cache import TieredCache
+from vector_store import NumpyVectorIndex, NumpyVectorIndexHandle, VectorIndexBuilder, read_vector_generation
 
 # Load environment variables
 load_dotenv()
@@ -30,6 +57,16 @@ app.add_middleware(
 # Request body schema
 class AskRequest(BaseModel):
     query: str
+    books: Optional[List[str]] = None  # restrict the search to these book filenames
+    page_from: Optional[int] = None  # and/or to chunks overlapping this page range
+    page_to: Optional[int] = None
+
+class AskBatchRequest(BaseModel):
+    queries: List[str]
+    n_results: int = Field(5, ge=1, le=50)
+    books: Optional[List[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
 
 class ComposeRequest(BaseModel):
     topic: str
@@ -40,55 +77,51 @@ class ComposeRequest(BaseModel):
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CHROMA_PERSIST_DIR = os.path.join(BASE_DIR, "data", "chroma")
 COLLECTION_NAME = "puja_books"
+# Lives inside the Chroma directory so wiping the store also resets the manifest
+MANIFEST_PATH = os.path.join(CHROMA_PERSIST_DIR, "ingest_manifest.json")
 
-def get_chroma_client():
-    """Get or create ChromaDB client and collection."""
-    client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR, settings=Settings())
-    collection = client.get_or_create_collection(COLLECTION_NAME)
-    return collection
+# Lexical (BM25) index over the same chunk ids, rebuilt by ingestion
+BM25_DIR = os.path.join(BASE_DIR, "data", "bm25")
+# hybrid (BM25 + vector, fused), vector or lexical
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Exported chunk embeddings for the NumPy backend, rebuilt by ingestion
+VECTOR_INDEX_DIR = os.path.join(BASE_DIR, "data", "vectors")
+# Chunk texts and metadata shared by the BM25 and vector indexes
+CHUNK_STORE_DIR = os.path.join(BASE_DIR, "data", "chunks")
+# chroma, or numpy (exact search over the memory-mapped float16 matrix; set
+# VECTOR_QUANTIZED=1 to search its int8 copy and re-rank, see vector_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text from PDF file."""
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        return ""
-
-def chunk_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
-    """Split text into chunks."""
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-    )
-    return splitter.split_text(text)
+# Ingestion splitter settings (recorded in the manifest; changing them re-ingests every book)
+INGEST_CHUNK_SIZE = 1000
+INGEST_CHUNK_OVERLAP = 200
+INGEST_MIN_CHUNK_CHARS = 50
 
-def read_books_text(only_books: List[str] = None) -> Dict[str, str]:
-    """Read full text from PDFs under ./pdfs and return mapping of filename -> text.
-    If only_books provided, restrict to those filenames.
-    """
-    pdf_dir = os.path.join(BASE_DIR, "pdfs")
-    texts: Dict[str, str] = {}
-    if not os.path.isdir(pdf_dir):
-        return texts
+# One collection handle per process, opened on first use and reused by every request;
+# it reopens once an ingest (in any worker) has moved the index generation
+collection_handle = CollectionHandle(
+    CHROMA_PERSIST_DIR, COLLECTION_NAME, get_embedding_function(), generation=lambda: read_generation(MANIFEST_PATH)
+)
+# Optional Redis (REDIS_URL) shared by the caches and the compose job queue
+redis_connection = RedisConnection()
+# Repeat queries (e.g. the preset buttons) skip model inference
+query_embedder = QueryEmbedder(get_embedding_function(), redis=redis_connection)
+bm25_handle = BM25IndexHandle(BM25_DIR)
+vector_index_handle = NumpyVectorIndexHandle(VECTOR_INDEX_DIR)
+search_timings = StageTimings()
+compose_timings = StageTimings()
 
-    for filename in os.listdir(pdf_dir):
-        if not filename.lower().endswith(".pdf"):
-            continue
-        if only_books and filename not in set(only_books):
-            continue
-        pdf_path = os.path.join(pdf_dir, filename)
-        content = extract_text_from_pdf(pdf_path)
-        if content:
-            texts[filename] = content
-    return texts
+# Compose map stage: parallel per-chunk extraction calls, each with its own
+# timeout, and an overall deadline after which unfinished chunks are dropped
+COMPOSE_CONCURRENCY = int(os.getenv("COMPOSE_CONCURRENCY", "4"))
+COMPOSE_CHUNK_TIMEOUT = float(os.getenv("COMPOSE_CHUNK_TIMEOUT", "60"))
+COMPOSE_MAP_TIMEOUT = float(os.getenv("COMPOSE_MAP_TIMEOUT", "90"))
+# Parsed chunk extractions survive restarts; repeat topics only pay for new chunks
+extraction_cache = ExtractionCache(EXTRACTION_CACHE_PATH, EXTRACTION_CACHE_MAX_BYTES)
+
+def get_chroma_client():
+    """Get the shared ChromaDB collection (opened lazily, reused across requests)."""
+    return collection_handle.get()
 
 def get_openai_client() -> OpenAI:
     api_key = os.getenv("OPENAI_API_KEY")
@@ -120,16 +153,147 @@ FINAL_PROMPT = (
     "Write naturally as if inside the ChatGPT app. Keep it clear and beginner-friendly."
 )
 
-def compose_from_books(topic: str, only_books: List[str] = None) -> Dict[str, str]:
-    """Compose a polished guide using OpenAI by reading book texts, chunking, summarizing, then finalizing."""
-    # 1) Read books
-    book_texts = read_books_text(only_books)
-    if not book_texts:
-        return {"content_markdown": "No books found to compose the guide."}
+def chunk_request_messages(topic: str, books: List[str], excerpts_text: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_FMT_INSTRUCTIONS},
+        {
+            "role": "user",
+            "content": (
+                f"Topic: {topic}\n\n"
+                f"Source Books: {', '.join(books)}\n\n"
+                f"Raw Excerpts (each marked with its source):\n" + excerpts_text + "\n\n" + CHUNK_PROMPT
+            ),
+        },
+    ]
+
+def task_label(task: Dict[str, Any]) -> str:
+    return "; ".join(f"{source['book']} p.{source['page']}" for source in task["sources"])
+
+def extract_chunk(client: OpenAI, topic: str, task: Dict[str, Any]) -> Dict[str, Any]:
+    """Ask the model for the structured items in one packed request of book
+    excerpts (see CHUNK_PROMPT and pack_excerpts).
+
+    Parsed replies are cached by topic, book and excerpt content, model,
+    prompt and temperature, so only cache misses reach the model.
+    """
+    model = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
+    temperature = 0.2
+    cache_key = extraction_cache_key(
+        topic, task["book_sha256"], task["chunk"], model, SYSTEM_FMT_INSTRUCTIONS + CHUNK_PROMPT, temperature
+    )
+    cached = extraction_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    resp = client.chat.completions.create(
+        model=model,
+        temperature=temperature,
+        timeout=COMPOSE_CHUNK_TIMEOUT,
+        messages=chunk_request_messages(topic, task["books"], task["chunk"]),
+    )
+    content = resp.choices[0].message.content or "{}"
+    # Try to parse JSON from the message. If it contains text + JSON, extract JSON block
+    json_str = content
+    # crude extraction of a JSON object
+    if "{" in content and "}" in content:
+        start = content.find("{")
+        end = content.rfind("}")
+        json_str = content[start : end + 1]
+    data = json.loads(json_str)
+    extraction_cache.put(cache_key, data)
+    return data
+
+def iter_chunk_extractions(
+    client: OpenAI, topic: str, tasks: List[Dict[str, Any]], max_results: int
+) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """Run extract_chunk over tasks on up to COMPOSE_CONCURRENCY threads,
+    yielding (task index, parsed data or None on failure) as calls finish.
+
+    Like the old sequential loop, the first ``max_results`` successful chunks
+    (in task order) are produced: the first max_results tasks start
+    immediately and each failure starts the next candidate. Unfinished calls
+    are abandoned once COMPOSE_MAP_TIMEOUT passes, or when the consumer stops
+    iterating. Each finished call sets its task's "latency_ms".
+    """
+    if not tasks or max_results <= 0:
+        return
+    deadline = time.monotonic() + COMPOSE_MAP_TIMEOUT
+    pool = ThreadPoolExecutor(max_workers=max(1, COMPOSE_CONCURRENCY), thread_name_prefix="compose")
+
+    def timed(task: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return extract_chunk(client, topic, task)
+        finally:
+            task["latency_ms"] = round(1000 * (time.perf_counter() - started), 1)
+            compose_timings.record("chunk", time.perf_counter() - started)
+
+    pending = {pool.submit(timed, task): i for i, task in enumerate(tasks[:max_results])}
+    next_task = len(pending)
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"Compose map stage timed out; dropping {len(pending)} unfinished chunks")
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    print(f"Chunk extraction failed for {task_label(tasks[i])}: {e}")
+                    data = None
+                    if next_task < len(tasks):
+                        pending[pool.submit(timed, tasks[next_task])] = next_task
+                        next_task += 1
+                yield i, data
+    finally:
+        # Queued calls are cancelled; running ones finish in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def final_pass_messages(topic: str, aggregated: Dict[str, Any]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_FMT_INSTRUCTIONS},
+        {
+            "role": "user",
+            "content": (
+                f"Compose a final, polished guide for: {topic}\n\n"
+                f"Here is the merged JSON draft from authentic books:\n\n{json.dumps(aggregated)}\n\n"
+                + FINAL_PROMPT
+            ),
+        },
+    ]
+
+def iter_compose_events(topic: str, only_books: List[str] = None, stream: bool = True) -> Iterator[Dict[str, Any]]:
+    """Compose a polished guide using OpenAI, as a sequence of events.
+
+    The chunks most relevant to the topic are retrieved and packed into
+    extraction requests of up to COMPOSE_TOKEN_BUDGET prompt tokens, then a
+    final pass writes the guide from the extracted items. Events:
+    {"event": "plan", "chunks", "requests"} once the inputs are chosen,
+    {"event": "chunk", "sources", "ok", "latency_ms", "done", "total"} as each
+    extraction request finishes, {"event": "reduce", ...} with the item and
+    token counts the local dedupe saved, {"event": "token", "text"} per piece of the final
+    guide when ``stream`` is set, and finally {"event": "result", "content_markdown",
+    "complete"}; complete is False when no extraction or the final pass failed.
+    """
+    # 1) Pick the map-stage inputs from the index; no PDF is parsed per request.
+    # Extra candidates replace chunks whose extraction fails.
+    max_total_chunks = int(os.getenv("COMPOSE_MAX_TOTAL_CHUNKS", "8"))
+    candidate_chunks = int(os.getenv("COMPOSE_CANDIDATE_CHUNKS", str(max_total_chunks * 2)))
+    hits = search_books(topic, n_results=max(candidate_chunks, max_total_chunks), books=only_books or None)
+    if not hits:
+        yield {
+            "event": "result",
+            "content_markdown": "No relevant passages found in the books to compose the guide.",
+            "complete": False,
+        }
+        return
 
     client = get_openai_client()
 
-    # 2) Per-book chunking and extraction
+    # 2) Per-chunk extraction
     aggregated: Dict[str, Any] = {
         "materials": [],
         "steps": [],
@@ -141,156 +305,477 @@ def compose_from_books(topic: str, only_books: List[str] = None) -> Dict[str, st
         "sources": [],
     }
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=3000, chunk_overlap=300)
+    # Pack as many excerpts per request as the token budget allows: the top
+    # COMPOSE_MAX_TOTAL_CHUNKS first, the remaining candidates only as backfill
+    excerpts = [{"book": hit["book"], "page": hit["page"], "chunk": hit["content"]} for hit in hits]
+    count_tokens = token_counter(os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini"))
+    all_books = list(dict.fromkeys(excerpt["book"] for excerpt in excerpts))
+    overhead = sum(count_tokens(m["content"]) for m in chunk_request_messages(topic, all_books, ""))
+    packs = pack_excerpts(excerpts[:max_total_chunks], COMPOSE_TOKEN_BUDGET, count_tokens, overhead)
+    primary = len(packs)
+    packs += pack_excerpts(excerpts[max_total_chunks:], COMPOSE_TOKEN_BUDGET, count_tokens, overhead)
 
-    # Hard limits to keep requests responsive
-    max_books_to_process = int(os.getenv("COMPOSE_MAX_BOOKS", "3"))
-    max_chunks_per_book = int(os.getenv("COMPOSE_MAX_CHUNKS_PER_BOOK", "3"))
-    max_total_chunks = int(os.getenv("COMPOSE_MAX_TOTAL_CHUNKS", "8"))
-    processed_total_chunks = 0
-
-    for book_index, (filename, text) in enumerate(book_texts.items()):
-        if book_index >= max_books_to_process:
-            break
-        chunks_all = splitter.split_text(text)
-        # Take only the first N reasonably sized chunks per book
-        chunks = chunks_all[:max_chunks_per_book]
-        for idx, chunk in enumerate(chunks):
-            if processed_total_chunks >= max_total_chunks:
-                break
-            # Guard against extremely small or whitespace-only chunks
-            if len(chunk.strip()) < 100:
-                continue
-            try:
-                resp = client.chat.completions.create(
-                    model=os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini"),
-                    temperature=0.2,
-                    timeout=60,
-                    messages=[
-                        {"role": "system", "content": SYSTEM_FMT_INSTRUCTIONS},
-                        {
-                            "role": "user",
-                            "content": (
-                                f"Topic: {topic}\n\n"
-                                f"Source Book: {filename} (chunk {idx+1}/{len(chunks)})\n\n"
-                                f"Raw Excerpt:\n" + chunk + "\n\n" + CHUNK_PROMPT
-                            ),
-                        },
-                    ],
-                )
-                content = resp.choices[0].message.content or "{}"
-                # Try to parse JSON from the message. If it contains text + JSON, extract JSON block
-                import json as _json
-                json_str = content
-                # crude extraction of a JSON object
-                if "{" in content and "}" in content:
-                    start = content.find("{")
-                    end = content.rfind("}")
-                    json_str = content[start : end + 1]
-                data = _json.loads(json_str)
-            except Exception:
-                continue
+    # Content hashes of the indexed books (part of the extraction cache key)
+    indexed_books = load_manifest(MANIFEST_PATH)["books"]
+    tasks = []
+    for pack in packs:
+        books = list(dict.fromkeys(excerpt["book"] for excerpt in pack))
+        tasks.append({
+            "sources": [{"book": excerpt["book"], "page": excerpt["page"]} for excerpt in pack],
+            "books": books,
+            "book_sha256": ",".join(indexed_books.get(book, {}).get("sha256", "") for book in books),
+            "chunk": format_excerpts(pack),
+        })
+    yield {"event": "plan", "chunks": min(len(excerpts), max_total_chunks), "requests": primary}
 
-            # Merge
-            for key in ["materials", "steps", "timings", "dos", "donts", "mantras", "notes"]:
-                if key in data and isinstance(data[key], list):
-                    aggregated[key].extend(data[key])
-            aggregated["sources"].append({"book": filename, "chunk_index": idx})
-            processed_total_chunks += 1
+    results: List[Optional[Dict[str, Any]]] = [None] * len(tasks)
+    succeeded = 0
+    with compose_timings.stage("map"):
+        for i, data in iter_chunk_extractions(client, topic, tasks, primary):
+            results[i] = data
+            succeeded += data is not None
+            yield {
+                "event": "chunk",
+                "sources": tasks[i]["sources"],
+                "ok": data is not None,
+                "latency_ms": tasks[i].get("latency_ms"),
+                "done": succeeded,
+                "total": primary,
+            }
+    print(f"Compose map stage for {topic!r}: " + ", ".join(
+        f"[{task_label(task)}] {task['latency_ms']}ms" for task in tasks if "latency_ms" in task
+    ))
+
+    # Merge in plan order, so the draft does not depend on which call returned first
+    for task, data in zip(tasks, results):
+        if data is None:
+            continue
+        for key in ["materials", "steps", "timings", "dos", "donts", "mantras", "notes"]:
+            if key in data and isinstance(data[key], list):
+                aggregated[key].extend(data[key])
+        aggregated["sources"].extend(task["sources"])
+
+    # Local reduce: chunks overlap, so the same items come back several times
+    with compose_timings.stage("reduce"):
+        aggregated, reduce_stats = reduce_draft(aggregated, count_tokens)
+    print(
+        f"Compose reduce for {topic!r}: {reduce_stats['items_before']} -> {reduce_stats['items_after']} items, "
+        f"{reduce_stats['tokens_saved']} prompt tokens saved"
+    )
+    yield {"event": "reduce", **reduce_stats}
 
     # 3) Final polishing pass
+    parts: List[str] = []
+    complete = succeeded > 0
     try:
-        final_resp = client.chat.completions.create(
-            model=os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini"),
-            temperature=0.3,
-            timeout=60,
-            messages=[
-                {"role": "system", "content": SYSTEM_FMT_INSTRUCTIONS},
-                {
-                    "role": "user",
-                    "content": (
-                        f"Compose a final, polished guide for: {topic}\n\n"
-                        f"Here is the merged JSON draft from authentic books:\n\n{json.dumps(aggregated)}\n\n"
-                        + FINAL_PROMPT
-                    ),
-                },
-            ],
-        )
-        final_text = final_resp.choices[0].message.content or ""
+        with compose_timings.stage("final"):
+            final_resp = client.chat.completions.create(
+                model=os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini"),
+                temperature=0.3,
+                timeout=60,
+                messages=final_pass_messages(topic, aggregated),
+                stream=stream,
+            )
+            if stream:
+                for part in final_resp:
+                    text = part.choices[0].delta.content if part.choices else None
+                    if text:
+                        parts.append(text)
+                        yield {"event": "token", "text": text}
+            else:
+                parts.append(final_resp.choices[0].message.content or "")
+        final_text = "".join(parts)
     except Exception as e:
-        final_text = f"Error finalizing guide: {e}"
+        # Anything already streamed stays in front of the error
+        final_text = "".join(parts) + f"Error finalizing guide: {e}"
+        complete = False
 
-    return {"content_markdown": final_text}
+    yield {"event": "result", "content_markdown": final_text, "complete": complete}
+
+def compose_from_books(topic: str, only_books: List[str] = None) -> Dict[str, Any]:
+    """Compose a polished guide in one call (see iter_compose_events)."""
+    for event in iter_compose_events(topic, only_books, stream=False):
+        if event["event"] == "result":
+            return {"content_markdown": event["content_markdown"], "complete": event["complete"]}
+    return {"content_markdown": "", "complete": False}
+
+def rebuild_derived_indexes(
+    collection, generation: int, fresh_embeddings: Optional[Dict[str, np.ndarray]] = None
+) -> bool:
+    """Rebuild the chunk store, BM25 and NumPy vector indexes from every chunk in the collection.
+
+    Only documents and metadata are read from Chroma, in pages of
+    INGEST_BATCH_SIZE. Embeddings come from ``fresh_embeddings`` (chunks
+    written by this ingest), the previous vector index (chunk ids change
+    whenever their content does) or, failing both, the embedding function.
+    Failures are logged and reported as False: searches keep using the
+    previous indexes and ingestion itself still succeeds.
+    """
+    try:
+        fresh_embeddings = fresh_embeddings or {}
+        previous = NumpyVectorIndex.load(VECTOR_INDEX_DIR)
+        previous_rows = {chunk_id: i for i, chunk_id in enumerate(previous.ids)} if previous else {}
+        embed = collection_handle.embedding_function or get_embedding_function()
+
+        total = collection.count()
+        chunks = ChunkStoreWriter(CHUNK_STORE_DIR)
+        vectors = VectorIndexBuilder(VECTOR_INDEX_DIR, total, generation)
+        reembedded = 0
+        for offset in range(0, total, INGEST_BATCH_SIZE):
+            page = collection.get(include=["documents", "metadatas"], limit=INGEST_BATCH_SIZE, offset=offset)
+            embeddings: List[Any] = []
+            missing = []
+            for i, chunk_id in enumerate(page["ids"]):
+                if chunk_id in fresh_embeddings:
+                    embeddings.append(fresh_embeddings[chunk_id])
+                elif chunk_id in previous_rows:
+                    embeddings.append(previous.vectors[previous_rows[chunk_id]])
+                else:
+                    embeddings.append(None)
+                    missing.append(i)
+            if missing:
+                for i, embedding in zip(missing, embed([page["documents"][i] for i in missing])):
+                    embeddings[i] = embedding
+                reembedded += len(missing)
+            chunks.add(page["ids"], page["documents"], page["metadatas"])
+            vectors.add(embeddings)
+        chunks_base = chunks.commit()
+        vectors.commit(chunks_base)
+        header = build_bm25_index(BM25_DIR, open_chunk_store(chunks_base), generation)
+        prune_chunk_stores(CHUNK_STORE_DIR, keep=[chunks_base])
+        print(
+            f"Derived indexes built: {header['documents']} chunks ({reembedded} re-embedded), "
+            f"{header['terms']} BM25 terms"
+        )
+        return True
+    except Exception:
+        traceback.print_exc()
+        print("Rebuilding the derived indexes failed; searches keep using the previous ones")
+        return False
 
-def ingest_pdfs():
-    """Ingest PDF files into ChromaDB."""
+def _indexed_book_titles(collection) -> List[str]:
+    """Return the distinct book titles currently stored in the collection."""
+    metadatas = collection.get(include=["metadatas"]).get("metadatas") or []
+    return sorted({m.get("book_title") for m in metadatas if m and m.get("book_title")})
+
+def ingest_pdfs(progress: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+    """Incrementally sync ChromaDB with the PDFs under ./pdfs.
+
+    Books are tracked in an ingestion manifest keyed by content hash, size,
+    mtime and splitter settings: unchanged books are skipped, changed books
+    have their chunks replaced and removed books are purged. ``progress``
+    receives keyword updates as books and batches complete (see IngestJob).
+    """
+    progress = progress or (lambda **updates: None)
     collection = get_chroma_client()
-    
-    # Check if collection is empty
-    if collection.count() > 0:
-        print(f"Collection already has {collection.count()} documents")
-        return
-    
     pdf_dir = os.path.join(BASE_DIR, "pdfs")
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    
-    total_chunks = 0
-    for filename in os.listdir(pdf_dir):
-        if not filename.endswith(".pdf"):
-            continue
-            
-        pdf_path = os.path.join(pdf_dir, filename)
+    splitter_settings = {
+        "chunk_size": INGEST_CHUNK_SIZE,
+        "chunk_overlap": INGEST_CHUNK_OVERLAP,
+        "min_chunk_chars": INGEST_MIN_CHUNK_CHARS,
+        # Chunks carry real PDF page spans (older stores used chunk indexes)
+        "page_spans": True,
+        # and precomputed structured facts (see structured_extraction.py)
+        "structured_facts": FACTS_VERSION,
+    }
+
+    manifest = load_manifest(MANIFEST_PATH)
+    if collection.count() == 0:
+        # Store was wiped (or never built): nothing the manifest remembers is indexed
+        manifest["books"] = {}
+    elif not manifest["books"]:
+        # Store built before the manifest existed: adopt its books so stale ones get purged
+        for title in _indexed_book_titles(collection):
+            manifest["books"][title] = {"sha256": None}
+
+    fingerprints: Dict[str, Dict[str, Any]] = {}
+    if os.path.isdir(pdf_dir):
+        for filename in os.listdir(pdf_dir):
+            if not filename.lower().endswith(".pdf"):
+                continue
+            pdf_path = os.path.join(pdf_dir, filename)
+            fingerprints[filename] = fingerprint_pdf(pdf_path, manifest["books"].get(filename))
+
+    plan = plan_ingestion(manifest, fingerprints, splitter_settings)
+    if not (plan["added"] or plan["changed"] or plan["deleted"]):
+        generation = manifest["generation"]
+        if collection.count() and (
+            read_bm25_generation(BM25_DIR) != generation
+            or read_vector_generation(VECTOR_INDEX_DIR) != generation
+        ):
+            # Store predates the derived indexes (or they were deleted): build them once
+            rebuild_derived_indexes(collection, generation)
+    to_ingest_names = plan["added"] + plan["changed"]
+    progress(
+        books_total=len(to_ingest_names),
+        bytes_total=sum(fingerprints[f]["size"] for f in to_ingest_names),
+    )
+    if not (plan["added"] or plan["changed"] or plan["deleted"]):
+        print(f"Collection up to date ({len(plan['unchanged'])} books, {collection.count()} documents)")
+        return plan
+
+    # Bumped before and after the rewrite: answers cached mid-ingest never outlive it
+    manifest["generation"] += 1
+    save_manifest(MANIFEST_PATH, manifest)
+
+    for filename in plan["deleted"]:
+        print(f"Purging {filename}...")
+        collection.delete(where={"book_title": filename})
+        manifest["books"].pop(filename, None)
+        save_manifest(MANIFEST_PATH, manifest)
+
+    for filename in plan["unchanged"]:
+        # Keep touched-but-identical files from being re-hashed next time
+        manifest["books"][filename].update(fingerprints[filename])
+
+    to_ingest = [os.path.join(pdf_dir, f) for f in to_ingest_names]
+    # Pages stream out of the parallel extractor in order, are chunked
+    # incrementally and go straight to the writer: no whole-book strings
+    failed: set = set()
+    hashes = {os.path.join(pdf_dir, f): fingerprints[f]["sha256"] for f in fingerprints}
+    pages = iter_cached_book_pages(to_ingest, hashes=hashes, failed=failed)
+
+    # Chunk ids are unique per book version, splitter settings and run, so a
+    # rewrite never re-adds an id Chroma has deleted (0.4.x then drops the vector)
+    splitter_hash = hashlib.sha256(json.dumps(splitter_settings, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    # Embedded here rather than by Chroma, so the derived indexes never read vectors back
+    fresh_embeddings: Dict[str, np.ndarray] = {}
+    writer = BatchedIndexWriter(
+        collection,
+        embedding_function=collection_handle.embedding_function or get_embedding_function(),
+        on_flush=lambda w: progress(chunks_embedded=w.chunks_written),
+        on_embeddings=lambda ids, embeddings: fresh_embeddings.update(
+            zip(ids, np.asarray(embeddings, dtype=np.float16))
+        ),
+    )
+    books_done = 0
+    bytes_done = 0
+    indexed: set = set()
+    for pdf_path, book_pages in groupby(pages, key=lambda page: page[0]):
+        filename = os.path.basename(pdf_path)
         print(f"Processing {filename}...")
-        
-        text = extract_text_from_pdf(pdf_path)
-        if text:
-            chunks = splitter.split_text(text)
-            
-            for i, chunk in enumerate(chunks):
-                # Clean the chunk
-                chunk = re.sub(r'\s+', ' ', chunk).strip()
-                if len(chunk) < 50:  # Skip very short chunks
-                    continue
-                    
-                collection.add(
-                    documents=[chunk],
-                    metadatas=[{
-                        "book_title": filename,
-                        "page": i,
-                        "chunk_id": f"{filename}_{i}"
-                    }],
-                    ids=[f"{filename}_{i}"]
-                )
-            total_chunks += len(chunks)
-            print(f"Added {len(chunks)} chunks from {filename}")
-    
-    print(f"Ingestion complete. Total chunks: {total_chunks}")
+        progress(current_book=filename)
+
+        # Forget the book until its new chunks are in, so a failure or crash
+        # mid-rewrite leaves it to be re-added on the next run
+        old_ids = set(collection.get(where={"book_title": filename}, include=[])["ids"])
+        if manifest["books"].pop(filename, None) is not None:
+            save_manifest(MANIFEST_PATH, manifest)
+
+        id_prefix = f"{filename}:{fingerprints[filename]['sha256'][:12]}:{splitter_hash}:{manifest['generation']}"
+        new_ids = []
+        added = 0
+        chunks = iter_page_chunks(
+            ((page_number, text) for _, page_number, text in book_pages),
+            chunk_size=INGEST_CHUNK_SIZE,
+            chunk_overlap=INGEST_CHUNK_OVERLAP,
+        )
+        for i, (chunk, page_start, page_end) in enumerate(chunks):
+            # Clean the chunk
+            chunk = re.sub(r'\s+', ' ', chunk).strip()
+            if len(chunk) < INGEST_MIN_CHUNK_CHARS:  # Skip very short chunks
+                continue
+
+            writer.add(
+                chunk,
+                {
+                    "book_title": filename,
+                    "page": page_start,
+                    "page_start": page_start,
+                    "page_end": page_end,
+                    "chunk_index": i,
+                    "chunk_id": f"{id_prefix}:{i}",
+                    "structured_facts": facts_to_metadata(chunk_facts(chunk)),
+                },
+                f"{id_prefix}:{i}",
+            )
+            new_ids.append(f"{id_prefix}:{i}")
+            added += 1
+
+        # Only record the book once its chunks are actually persisted
+        writer.flush()
+        books_done += 1
+        bytes_done += fingerprints[filename]["size"]
+        progress(books_done=books_done, bytes_done=bytes_done)
+        if pdf_path in failed:
+            # Leave no half-indexed book behind; it is retried on the next run
+            collection.delete(where={"book_title": filename})
+            continue
+        # Only now drop the chunks of the previous version
+        stale_ids = sorted(old_ids.difference(new_ids))
+        for start in range(0, len(stale_ids), INGEST_BATCH_SIZE):
+            collection.delete(ids=stale_ids[start:start + INGEST_BATCH_SIZE])
+        print(f"Added {added} chunks from {filename}")
+        manifest["books"][filename] = dict(fingerprints[filename], chunks=added)
+        save_manifest(MANIFEST_PATH, manifest)
+        indexed.add(filename)
+
+    for filename in to_ingest_names:
+        if filename not in indexed and filename in manifest["books"]:
+            # Failed before yielding a page: its old chunks may predate the
+            # new splitter settings, so drop the book until a run succeeds
+            print(f"Dropping {filename} until its text can be extracted")
+            collection.delete(where={"book_title": filename})
+            manifest["books"].pop(filename)
+            save_manifest(MANIFEST_PATH, manifest)
+
+    # Recorded last: books not rewritten by now (crash) are re-chunked next run
+    manifest["splitter"] = splitter_settings
+    manifest["generation"] += 1
+    save_manifest(MANIFEST_PATH, manifest)
+    rebuild_derived_indexes(collection, manifest["generation"], fresh_embeddings)
+    text_cache.prune(hashes.values())
+    print(
+        f"Ingestion complete. Added {len(plan['added'])}, updated {len(plan['changed'])}, "
+        f"purged {len(plan['deleted'])}, skipped {len(plan['unchanged'])} books. "
+        f"{writer.report()}"
+    )
+    return dict(plan, stats=writer.stats())
+
+def _vector_search_many(
+    queries: List[str],
+    k: int,
+    books: Optional[List[str]] = None,
+    page_from: Optional[int] = None,
+    page_to: Optional[int] = None,
+) -> List[List[Dict[str, Any]]]:
+    """Vector hits for several queries: one embedding pass and one backend query.
+
+    VECTOR_BACKEND selects Chroma (default) or the memory-mapped NumPy index;
+    the NumPy backend falls back to Chroma until its index has been built.
+    """
+    with search_timings.stage("embed"):
+        query_embeddings = query_embedder.embed(queries)
+
+    numpy_index = vector_index_handle.get() if VECTOR_BACKEND == "numpy" else None
+    if numpy_index is not None:
+        with search_timings.stage("vector"):
+            mask = numpy_index.filter_mask(books, page_from, page_to)
+            return numpy_index.search_many(query_embeddings, k, mask)
 
-def search_books(query: str, n_results: int = 5) -> List[Dict[str, Any]]:
-    """Search through the books for relevant information."""
     collection = get_chroma_client()
-    
-    try:
+    with search_timings.stage("vector"):
         results = collection.query(
-            query_texts=[query],
-            n_results=n_results,
+            query_embeddings=query_embeddings,
+            n_results=k,
+            where=chroma_where(books, page_from, page_to),
             include=["documents", "metadatas", "distances"]
         )
-        
-        search_results = []
-        if results['documents'] and results['documents'][0]:
-            for i, doc in enumerate(results['documents'][0]):
-                search_results.append({
+    all_hits = []
+    for q in range(len(queries)):
+        hits = []
+        if results['documents'] and results['documents'][q]:
+            for i, doc in enumerate(results['documents'][q]):
+                if doc is None or results['metadatas'][q][i] is None:
+                    # Deleted by an ingest in another worker after this one opened
+                    # the collection; it reopens when the generation moves
+                    continue
+                hits.append({
+                    "id": results['ids'][q][i],
                     "content": doc,
-                    "book": results['metadatas'][0][i]['book_title'],
-                    "page": results['metadatas'][0][i]['page'],
-                    "relevance_score": 1 - results['distances'][0][i] if results['distances'] else 0
+                    "metadata": results['metadatas'][q][i],
+                    "score": 1 - results['distances'][q][i] if results['distances'] else 0,
                 })
-        
-        return search_results
+        all_hits.append(hits)
+    return all_hits
+
+def _lexical_search(bm25: BM25Index, query: str, k: int, mask=None) -> List[Dict[str, Any]]:
+    with search_timings.stage("bm25"):
+        ranked = bm25.search(query, k, mask)
+    top_score = ranked[0][1] if ranked else 1.0
+    return [
+        {
+            "id": bm25.ids[i],
+            "content": bm25.documents[i],
+            "metadata": bm25.metadatas[i],
+            "score": score / top_score,
+        }
+        for i, score in ranked
+    ]
+
+def _search_result(hit: Dict[str, Any], score: float) -> Dict[str, Any]:
+    return {
+        "content": hit["content"],
+        "book": hit["metadata"]['book_title'],
+        "page": hit["metadata"]['page'],
+        "relevance_score": score,
+        "structured_facts": hit["metadata"].get("structured_facts"),
+    }
+
+def _fuse_hits(
+    lexical: List[Dict[str, Any]], vector: List[Dict[str, Any]], n_results: int
+) -> List[Dict[str, Any]]:
+    if not lexical:
+        return [_search_result(hit, hit["score"]) for hit in vector[:n_results]]
+    with search_timings.stage("fuse"):
+        hits = {hit["id"]: hit for hit in lexical}
+        hits.update({hit["id"]: hit for hit in vector})
+        fused = reciprocal_rank_fusion([
+            [hit["id"] for hit in vector],
+            [hit["id"] for hit in lexical],
+        ])
+    return [_search_result(hits[f["id"]], f["score"]) for f in fused[:n_results]]
+
+def search_books_batch(
+    queries: List[str],
+    n_results: int = 5,
+    books: Optional[List[str]] = None,
+    page_from: Optional[int] = None,
+    page_to: Optional[int] = None,
+) -> List[List[Dict[str, Any]]]:
+    """Search several queries at once; returns one result list per query, in order.
+
+    In hybrid mode (RETRIEVAL_MODE, the default) BM25 and vector hits are
+    fused with reciprocal rank fusion; exact-term queries (Devanagari or
+    quoted) that BM25 answers fully skip the embedding path. Every query
+    that does need vectors shares one embedding pass and one Chroma query.
+    ``books`` and the page range are applied inside both searches (a Chroma
+    ``where`` clause and a BM25 document mask), never by post-filtering.
+    Per-stage timings are kept in search_timings.
+    Errors propagate (after logging) so that callers never cache an empty
+    result caused by a transient failure.
+    """
+    try:
+        with search_timings.stage("total"):
+            bm25 = bm25_handle.get() if RETRIEVAL_MODE != "vector" else None
+            mask = bm25.filter_mask(books, page_from, page_to) if bm25 is not None else None
+            lexical = [
+                _lexical_search(bm25, query, n_results * 2, mask) if bm25 is not None else []
+                for query in queries
+            ]
+
+            results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+            needs_vector = []
+            for i, query in enumerate(queries):
+                if bm25 is not None and (
+                    RETRIEVAL_MODE == "lexical"
+                    or (is_exact_term_query(query) and len(lexical[i]) >= n_results)
+                ):
+                    results[i] = [_search_result(hit, hit["score"]) for hit in lexical[i][:n_results]]
+                else:
+                    needs_vector.append(i)
+
+            if needs_vector:
+                k = n_results * 2 if bm25 is not None else n_results
+                vector_hits = _vector_search_many(
+                    [queries[i] for i in needs_vector], k, books, page_from, page_to
+                )
+                for i, vector in zip(needs_vector, vector_hits):
+                    results[i] = _fuse_hits(lexical[i], vector, n_results)
+            return results
     except Exception as e:
         print(f"Error searching books: {e}")
-        return []
+        raise
+
+def search_books(
+    query: str,
+    n_results: int = 5,
+    books: Optional[List[str]] = None,
+    page_from: Optional[int] = None,
+    page_to: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Search through the books for relevant information (see search_books_batch)."""
+    return search_books_batch([query], n_results, books, page_from, page_to)[0]
 
 def create_structured_response(query: str, search_results: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Create a structured response based on search results."""
@@ -311,72 +796,22 @@ def create_structured_response(query: str, search_results: List[Dict[str, Any]])
     # Create summary
     summary = f"Information about {query} based on authentic texts: {all_content[:300]}..."
     
-    # Extract steps (look for numbered lists, bullet points, etc.)
-    steps = []
-    step_patterns = [
-        r'(\d+\.\s*[^.]*\.)',
-        r'(step\s*\d+[^.]*\.)',
-        r'(first[^.]*\.)',
-        r'(second[^.]*\.)',
-        r'(third[^.]*\.)',
-        r'(then[^.]*\.)',
-        r'(next[^.]*\.)',
-        r'(after[^.]*\.)'
-    ]
-    
-    for pattern in step_patterns:
-        matches = re.findall(pattern, all_content, re.IGNORECASE)
-        for match in matches[:5]:  # Limit to 5 steps
-            steps.append({
-                "title": f"Step {len(steps) + 1}",
-                "instruction": match.strip()
-            })
-    
-    # Extract materials (look for common puja items)
-    materials = []
-    material_keywords = [
-        "incense", "flowers", "coconut", "banana", "ghee", "kumkum", "chandan",
-        "kalash", "diya", "camphor", "sweets", "fruits", "rice", "water",
-        "mango leaves", "tulsi", "betel leaves", "betel nuts"
-    ]
-    
-    for keyword in material_keywords:
-        if keyword.lower() in all_content.lower():
-            materials.append({
-                "name": keyword.title(),
-                "product_match": "https://www.amazon.in"
-            })
-    
-    # Extract timings
-    timings = []
-    timing_patterns = [
-        r'(morning[^.]*\.)',
-        r'(evening[^.]*\.)',
-        r'(sunrise[^.]*\.)',
-        r'(sunset[^.]*\.)',
-        r'(brahma muhurta[^.]*\.)',
-        r'(amavasya[^.]*\.)',
-        r'(purnima[^.]*\.)'
+    # Steps, materials, timings and mantras were extracted per chunk at ingest;
+    # chunks indexed without them are extracted now
+    fields = merge_chunk_facts(
+        facts_from_metadata(result.get("structured_facts")) or chunk_facts(result["content"])
+        for result in search_results
+    )
+    steps = [
+        {"title": f"Step {i}", "instruction": instruction}
+        for i, instruction in enumerate(fields["steps"], start=1)
     ]
-    
-    for pattern in timing_patterns:
-        matches = re.findall(pattern, all_content, re.IGNORECASE)
-        for match in matches:
-            timings.append(match.strip())
-    
-    # Extract mantras (look for Sanskrit text)
-    mantras = []
-    mantra_patterns = [
-        r'(ॐ[^।]*।)',
-        r'(om[^.]*\.)',
-        r'(namah[^.]*\.)',
-        r'(swaha[^.]*\.)'
+    materials = [
+        {"name": keyword.title(), "product_match": "https://www.amazon.in"}
+        for keyword in fields["materials"]
     ]
-    
-    for pattern in mantra_patterns:
-        matches = re.findall(pattern, all_content, re.IGNORECASE)
-        for match in matches:
-            mantras.append(match.strip())
+    timings = fields["timings"]
+    mantras = fields["mantras"]
     
     # Create sources list
     sources = []
@@ -402,66 +837,392 @@ def create_structured_response(query: str, search_results: List[Dict[str, Any]])
 def root():
     return {"message": "RAG Puja AI API is running! (Using your uploaded books)"}
 
+# Ingestion runs in the background (at startup or via /admin/ingest), never on the request path
+ingest_job = IngestJob(ingest_pdfs, lock_path=os.path.join(BASE_DIR, "data", "ingest.lock"))
+
+@app.on_event("startup")
+def start_background_ingestion():
+    if os.getenv("INGEST_ON_STARTUP", "1") == "1":
+        ingest_job.start(reason="startup")
+
+@app.on_event("shutdown")
+def close_collection():
+    collection_handle.close()
+    extraction_cache.close()
+    compose_jobs.stop()
+
+def index_warming_response() -> Dict[str, Any]:
+    status = ingest_job.status()
+    eta = status.get("eta_seconds")
+    if status.get("books_total"):
+        notes = f"Indexing {status['books_done']}/{status['books_total']} books"
+        notes += f", about {int(eta)}s remaining." if eta is not None else "."
+    else:
+        notes = "Scanning the book library."
+    return {
+        "summary": "The book index is still warming up. Please try again shortly.",
+        "steps": [],
+        "materials": [],
+        "timings": [],
+        "mantras": [],
+        "sources": [],
+        "notes": notes,
+        "index_status": "warming",
+    }
+
+# Answers are deterministic for a (query, n_results, index generation), so cache
+# them: in process, and in Redis (when REDIS_URL is set) for the other workers
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+answer_cache = TieredCache(
+    # v2: entries record the query they were built for
+    "ask:v2",
+    LRUCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512")),
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+        max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ),
+    ANSWER_CACHE_TTL_SECONDS,
+    redis=redis_connection,
+)
+# Identical asks arriving together (e.g. a preset button at a festival) share one search
+ask_flight = SingleFlight()
+
+def search_scope(request) -> Dict[str, Any]:
+    """Book/page filter of an ask request, as search_books keyword arguments."""
+    return {"books": request.books, "page_from": request.page_from, "page_to": request.page_to}
+
+def answer_cache_key(query: str, n_results: int, scope: Dict[str, Any]) -> tuple:
+    books = tuple(sorted(scope.get("books") or ()))
+    return (
+        normalize_query(query), n_results, books, scope.get("page_from"), scope.get("page_to"),
+        read_generation(MANIFEST_PATH),
+    )
+
+def answer_for_query(response: Dict[str, Any], built_for: str, query: str) -> Dict[str, Any]:
+    """An answer built for another spelling of the same normalized query,
+    with the summary naming ``query`` instead (nothing else mentions it)."""
+    prefix = f"Information about {built_for}"
+    if built_for != query and response.get("summary", "").startswith(prefix):
+        response = dict(response, summary=f"Information about {query}" + response["summary"][len(prefix):])
+    return response
+
+def cached_answer(query: str, n_results: int, scope: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Stored as JSON: compact to size, and every hit gets its own copy
+    cached = answer_cache.get(answer_cache_key(query, n_results, scope))
+    if cached is None:
+        return None
+    entry = json.loads(cached)
+    return answer_for_query(entry["response"], entry["query"], query)
+
+def build_answer(
+    query: str, n_results: int, scope: Dict[str, Any], search_results: List[Dict[str, Any]], warming: bool
+) -> Dict[str, Any]:
+    """Structured response for a query; cached unless the index is still warming."""
+    response = create_structured_response(query, search_results)
+    if warming:
+        # Answer from whatever is indexed so far
+        response["notes"] += " (The book index is still being built; results may be partial.)"
+        response["index_status"] = "warming"
+    else:
+        entry = {"query": query, "response": response}
+        answer_cache.put(answer_cache_key(query, n_results, scope), json.dumps(entry, ensure_ascii=False))
+    return response
+
 # Chat endpoint
 @app.post("/api/ask")
 def ask_question(request: AskRequest):
     try:
-        # First, ensure books are ingested
-        ingest_pdfs()
-        
-        # Search through the books
-        search_results = search_books(request.query, n_results=5)
-        
-        # Create structured response
-        response = create_structured_response(request.query, search_results)
-        
-        return response
+        n_results = 5
+        scope = search_scope(request)
+        warming = ingest_job.running
+        if not warming:
+            cached = cached_answer(request.query, n_results, scope)
+            if cached is not None:
+                return cached
+        elif get_chroma_client().count() == 0:
+            return index_warming_response()
+
+        def answer() -> Dict[str, Any]:
+            # Search through the books
+            search_results = search_books(request.query, n_results=n_results, **scope)
+
+            # Create structured response
+            return {"query": request.query, "response": build_answer(request.query, n_results, scope, search_results, warming)}
+
+        shared, _ = ask_flight.do(answer_cache_key(request.query, n_results, scope) + (warming,), answer)
+        return answer_for_query(shared["response"], shared["query"], request.query)
 
     except Exception as e:
-        return {
-            "summary": "Error occurred while processing your request",
-            "steps": [],
-            "materials": [],
-            "timings": [],
-            "mantras": [],
-            "sources": [],
-            "notes": f"Error: {str(e)}. Please try again."
-        }
+        return ask_error_response(e)
+
+def ask_error_response(e: Exception) -> Dict[str, Any]:
+    return {
+        "summary": "Error occurred while processing your request",
+        "steps": [],
+        "materials": [],
+        "timings": [],
+        "mantras": [],
+        "sources": [],
+        "notes": f"Error: {str(e)}. Please try again."
+    }
+
+def iter_batch_answers(queries: List[str], n_results: int, scope: Dict[str, Any]) -> Iterator[str]:
+    """NDJSON lines for a batch of queries, emitted as each answer is ready.
+
+    Cached answers go out first; the rest are searched in slices of
+    ASK_BATCH_SLICE queries, each slice costing one embedding pass and one
+    Chroma query.
+    """
+    slice_size = max(1, int(os.getenv("ASK_BATCH_SLICE", "64")))
+    warming = ingest_job.running
+
+    def line(index: int, response: Dict[str, Any]) -> str:
+        return json.dumps({"index": index, "query": queries[index], "response": response}, ensure_ascii=False) + "\n"
+
+    if warming and get_chroma_client().count() == 0:
+        for i in range(len(queries)):
+            yield line(i, index_warming_response())
+        return
+
+    pending = []
+    for i, query in enumerate(queries):
+        cached = None if warming else cached_answer(query, n_results, scope)
+        if cached is not None:
+            yield line(i, cached)
+        else:
+            pending.append(i)
+
+    for start in range(0, len(pending), slice_size):
+        batch = pending[start:start + slice_size]
+        try:
+            batch_results = search_books_batch([queries[i] for i in batch], n_results=n_results, **scope)
+        except Exception as e:
+            # Nothing is cached for a failed slice, so a retry searches again
+            for i in batch:
+                yield line(i, ask_error_response(e))
+            continue
+        for i, search_results in zip(batch, batch_results):
+            try:
+                yield line(i, build_answer(queries[i], n_results, scope, search_results, warming))
+            except Exception as e:
+                yield line(i, ask_error_response(e))
+
+# Batch chat endpoint: many queries in one request, streamed back as NDJSON
+@app.post("/api/ask/batch")
+def ask_batch(request: AskBatchRequest):
+    max_queries = int(os.getenv("ASK_BATCH_MAX_QUERIES", "1000"))
+    if len(request.queries) > max_queries:
+        raise HTTPException(status_code=413, detail=f"At most {max_queries} queries per batch")
+    return StreamingResponse(
+        iter_batch_answers(request.queries, request.n_results, search_scope(request)),
+        media_type="application/x-ndjson",
+    )
 
 # Health check endpoint
 @app.get("/health")
 def health_check():
     collection = get_chroma_client()
+    ingest_status = ingest_job.status()
     return {
         "status": "healthy",
         "documents_count": collection.count(),
-        "message": "RAG system is ready"
+        "ingestion": ingest_status["state"],
+        "chroma": collection_handle.stats(),
+        "query_embedding_cache": query_embedder.stats(),
+        "answer_cache": answer_cache.stats(),
+        "search_timings": search_timings.stats(),
+        "compose_timings": compose_timings.stats(),
+        "extraction_cache": extraction_cache.stats(),
+        "compose_cache": compose_cache.stats(),
+        "compose_jobs": compose_jobs.stats(),
+        "single_flight": {"ask": ask_flight.stats(), "compose": compose_flight.stats()},
+        "index_generation": read_generation(MANIFEST_PATH),
+        "message": "RAG system is warming up" if ingest_job.running else "RAG system is ready"
     }
 
-# Compose endpoint: reads all books, calls ChatGPT, returns polished guide
+def check_admin_token(token: Optional[str]) -> None:
+    expected = os.getenv("ADMIN_TOKEN")
+    if expected and token != expected:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+# Admin: trigger a (re)ingestion run in the background
+@app.post("/admin/ingest")
+def trigger_ingestion(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    started = ingest_job.start(reason="admin")
+    return {"started": started, **ingest_job.status()}
+
+# Admin: ingestion progress (books done, chunks embedded, ETA)
+@app.get("/admin/ingest")
+def ingestion_status(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    return ingest_job.status()
+
+def compose_response(content_markdown: str) -> Dict[str, Any]:
+    """Uniform structure for the frontend."""
+    return {
+        "summary": None,
+        "steps": [],
+        "materials": [],
+        "timings": [],
+        "mantras": [],
+        "sources": [],
+        "notes": None,
+        "content_markdown": content_markdown,
+    }
+
+def compose_error_response(e: Exception) -> Dict[str, Any]:
+    return {
+        "summary": "Error composing guide",
+        "steps": [],
+        "materials": [],
+        "timings": [],
+        "mantras": [],
+        "sources": [],
+        "notes": f"Error: {str(e)}",
+        "content_markdown": ""
+    }
+
+# One compose run per distinct request in progress, shared by /api/compose
+# callers and compose jobs
+compose_flight = SingleFlight()
+# Finished guides, shared across workers through Redis when REDIS_URL is set
+COMPOSE_CACHE_TTL_SECONDS = float(os.getenv("COMPOSE_CACHE_TTL_SECONDS", "86400"))
+compose_cache = TieredCache(
+    "compose",
+    LRUCache(
+        max_entries=int(os.getenv("COMPOSE_CACHE_MAX_ENTRIES", "64")),
+        ttl_seconds=COMPOSE_CACHE_TTL_SECONDS,
+    ),
+    COMPOSE_CACHE_TTL_SECONDS,
+    redis=redis_connection,
+)
+
+def compose_cache_key(topic: str, only_books: Optional[List[str]]) -> tuple:
+    return (normalize_query(topic), tuple(sorted(only_books or ())), read_generation(MANIFEST_PATH))
+
+def cached_compose(
+    topic: str, only_books: Optional[List[str]], compose: Callable[[], Tuple[Dict[str, Any], bool]]
+) -> Tuple[Dict[str, Any], str]:
+    """The /api/compose payload for a request and where it came from.
+
+    Served from the compose cache ("cached"), from an identical run already
+    in progress ("coalesced"), or by ``compose()`` ("computed"), which
+    returns the payload and whether it is complete enough to cache.
+    """
+    key = compose_cache_key(topic, only_books)
+    cached = compose_cache.get(key)
+    if cached is not None:
+        return json.loads(cached), "cached"
+
+    def run() -> Dict[str, Any]:
+        response, complete = compose()
+        if complete:
+            compose_cache.put(key, json.dumps(response, ensure_ascii=False))
+        return response
+
+    response, shared = compose_flight.do(key, run)
+    return response, "coalesced" if shared else "computed"
+
+# Compose endpoint: retrieves relevant chunks, calls ChatGPT, returns polished guide
 @app.post("/api/compose")
 def compose_endpoint(payload: ComposeRequest):
     try:
-        result = compose_from_books(topic=payload.topic, only_books=payload.books)
-        # Return a uniform structure for the frontend
-        return {
-            "summary": None,
-            "steps": [],
-            "materials": [],
-            "timings": [],
-            "mantras": [],
-            "sources": [],
-            "notes": None,
-            "content_markdown": result.get("content_markdown", "")
-        }
+        def compose() -> Tuple[Dict[str, Any], bool]:
+            result = compose_from_books(topic=payload.topic, only_books=payload.books)
+            return compose_response(result.get("content_markdown", "")), result["complete"]
+
+        response, _ = cached_compose(payload.topic, payload.books, compose)
+        return response
     except Exception as e:
-        return {
-            "summary": "Error composing guide",
-            "steps": [],
-            "materials": [],
-            "timings": [],
-            "mantras": [],
-            "sources": [],
-            "notes": f"Error: {str(e)}",
-            "content_markdown": ""
-        }
+        return compose_error_response(e)
+
+def iter_compose_lines(topic: str, only_books: Optional[List[str]]) -> Iterator[str]:
+    """NDJSON lines for /api/compose/stream; the last line is always a "result"
+    event carrying the same payload /api/compose returns. A cached guide is
+    sent as that result event alone."""
+    try:
+        key = compose_cache_key(topic, only_books)
+        cached = compose_cache.get(key)
+        if cached is not None:
+            yield json.dumps({"event": "result", "response": json.loads(cached), "cached": True}, ensure_ascii=False) + "\n"
+            return
+        for event in iter_compose_events(topic, only_books):
+            if event["event"] == "result":
+                response = compose_response(event["content_markdown"])
+                if event["complete"]:
+                    compose_cache.put(key, json.dumps(response, ensure_ascii=False))
+                event = {"event": "result", "response": response}
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+    except Exception as e:
+        yield json.dumps({"event": "result", "response": compose_error_response(e)}, ensure_ascii=False) + "\n"
+
+# Streaming compose: progress per chunk extraction, then the guide token by token
+@app.post("/api/compose/stream")
+def compose_stream(payload: ComposeRequest):
+    return StreamingResponse(iter_compose_lines(payload.topic, payload.books), media_type="application/x-ndjson")
+
+def run_compose_job(topic: str, only_books: Optional[List[str]], progress: Callable[..., None]) -> Dict[str, Any]:
+    """Job runner: the /api/compose payload, with map-stage progress along the way.
+
+    A cached guide finishes the job at once, and a job identical to a compose
+    already running waits for that run; progress then records "source":
+    "cached" or "coalesced" instead of stage updates.
+    """
+    def compose() -> Tuple[Dict[str, Any], bool]:
+        for event in iter_compose_events(topic, only_books, stream=False):
+            if event["event"] == "plan":
+                progress(stage="map", chunks=event["chunks"], requests=event["requests"], requests_done=0)
+            elif event["event"] == "chunk":
+                progress(requests_done=event["done"])
+            elif event["event"] == "reduce":
+                progress(stage="final")
+            elif event["event"] == "result":
+                return compose_response(event["content_markdown"]), event["complete"]
+        return compose_response(""), False
+
+    result, source = cached_compose(topic, only_books, compose)
+    if source != "computed":
+        progress(source=source)
+    return result
+
+# Compose jobs: a bounded worker pool with Redis (REDIS_URL) as the shared
+# queue and result store, or process memory when Redis is absent
+compose_jobs = ComposeJobQueue(run_compose_job, redis=redis_connection)
+# Longest a single poll or event-stream wait may block
+COMPOSE_JOB_MAX_WAIT = float(os.getenv("COMPOSE_JOB_MAX_WAIT", "30"))
+
+# Submit a compose job; returns immediately with its id
+@app.post("/api/compose/jobs", status_code=202)
+def submit_compose_job(payload: ComposeRequest):
+    job = compose_jobs.submit(payload.topic, payload.books)
+    if job is None:
+        raise HTTPException(status_code=429, detail="Too many compose jobs queued, try again later")
+    return {"job_id": job["id"], "status": job["status"]}
+
+# Job status and, once done, its result; ?wait=N long-polls up to N seconds for completion
+@app.get("/api/compose/jobs/{job_id}")
+def get_compose_job(job_id: str, wait: float = 0):
+    job = compose_jobs.get(job_id, wait=min(max(wait, 0), COMPOSE_JOB_MAX_WAIT))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+def iter_compose_job_lines(job: Dict[str, Any]) -> Iterator[str]:
+    """NDJSON snapshots of a job, one per change, ending once it has finished."""
+    yield json.dumps(job, ensure_ascii=False) + "\n"
+    while job["status"] not in FINISHED:
+        latest = compose_jobs.get(job["id"], wait=COMPOSE_JOB_MAX_WAIT, version=job["version"])
+        if latest is None:
+            return
+        if latest["version"] != job["version"]:
+            yield json.dumps(latest, ensure_ascii=False) + "\n"
+        job = latest
+
+# Subscribe to a job: streams its status and progress until the result is in
+@app.get("/api/compose/jobs/{job_id}/events")
+def compose_job_events(job_id: str):
+    job = compose_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return StreamingResponse(iter_compose_job_lines(job), media_type="application/x-ndjson")
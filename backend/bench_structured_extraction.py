@@ -0,0 +1,131 @@
+"""Microbenchmark: legacy per-pattern regex extraction vs structured_extraction.
+
+Builds chunk sets from the PDFs in backend/pdfs (the same sets /api/ask sees:
+n_results chunks joined with spaces), checks that both implementations return
+identical fields for every set, and reports timings. A synthetic period-free
+text shows the backtracking case. Run from backend/:
+
+    python bench_structured_extraction.py --sets 200 --n-results 5
+"""
+import argparse
+import os
+import random
+import re
+import time
+from typing import List, Dict, Any
+
+from page_chunker import iter_page_chunks
+from structured_extraction import extract_structured_fields
+from text_cache import read_book_pages
+
+
+def legacy_extract(all_content: str) -> Dict[str, List[Any]]:
+    """The extraction create_structured_response did before the compiled engine."""
+    steps = []
+    step_patterns = [
+        r'(\d+\.\s*[^.]*\.)',
+        r'(step\s*\d+[^.]*\.)',
+        r'(first[^.]*\.)',
+        r'(second[^.]*\.)',
+        r'(third[^.]*\.)',
+        r'(then[^.]*\.)',
+        r'(next[^.]*\.)',
+        r'(after[^.]*\.)'
+    ]
+    for pattern in step_patterns:
+        matches = re.findall(pattern, all_content, re.IGNORECASE)
+        for match in matches[:5]:
+            steps.append(match.strip())
+
+    materials = []
+    material_keywords = [
+        "incense", "flowers", "coconut", "banana", "ghee", "kumkum", "chandan",
+        "kalash", "diya", "camphor", "sweets", "fruits", "rice", "water",
+        "mango leaves", "tulsi", "betel leaves", "betel nuts"
+    ]
+    for keyword in material_keywords:
+        if keyword.lower() in all_content.lower():
+            materials.append(keyword)
+
+    timings = []
+    timing_patterns = [
+        r'(morning[^.]*\.)',
+        r'(evening[^.]*\.)',
+        r'(sunrise[^.]*\.)',
+        r'(sunset[^.]*\.)',
+        r'(brahma muhurta[^.]*\.)',
+        r'(amavasya[^.]*\.)',
+        r'(purnima[^.]*\.)'
+    ]
+    for pattern in timing_patterns:
+        for match in re.findall(pattern, all_content, re.IGNORECASE):
+            timings.append(match.strip())
+
+    mantras = []
+    mantra_patterns = [
+        '(ॐ[^।]*।)',
+        r'(om[^.]*\.)',
+        r'(namah[^.]*\.)',
+        r'(swaha[^.]*\.)'
+    ]
+    for pattern in mantra_patterns:
+        for match in re.findall(pattern, all_content, re.IGNORECASE):
+            mantras.append(match.strip())
+
+    return {"steps": steps, "materials": materials, "timings": timings, "mantras": mantras}
+
+
+def load_chunks(pdf_dir: str) -> List[str]:
+    paths = sorted(os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.endswith(".pdf"))
+    chunks = []
+    for pages in read_book_pages(paths).values():
+        for chunk, _, _ in iter_page_chunks(enumerate(pages, start=1), chunk_size=1000, chunk_overlap=200):
+            chunks.append(chunk)
+    return chunks
+
+
+def bench(extract, texts: List[str], repeat: int) -> float:
+    """Best-of-repeat milliseconds per text."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            extract(text)
+        best = min(best, time.perf_counter() - started)
+    return 1000 * best / len(texts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdf-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdfs"))
+    parser.add_argument("--sets", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.pdf_dir)
+    rng = random.Random(args.seed)
+    workloads = {
+        f"{args.n_results} chunks": [
+            " ".join(rng.sample(chunks, min(args.n_results, len(chunks)))) for _ in range(args.sets)
+        ],
+        "50 chunks": [" ".join(rng.sample(chunks, min(50, len(chunks)))) for _ in range(max(1, args.sets // 10))],
+        # Long text without periods: every "then"/"om" rescans to the end in the legacy regexes
+        "no periods": [("then om after next morning " * 2000) for _ in range(3)],
+    }
+
+    print(f"{len(chunks)} chunks from {args.pdf_dir}")
+    print(f"{'workload':<14}{'texts':>7}{'avg chars':>11}{'legacy ms':>11}{'engine ms':>11}{'speedup':>9}")
+    for name, texts in workloads.items():
+        for text in texts:
+            if legacy_extract(text) != extract_structured_fields(text):
+                raise SystemExit(f"Output mismatch on workload {name!r}")
+        legacy_ms = bench(legacy_extract, texts, args.repeat)
+        engine_ms = bench(extract_structured_fields, texts, args.repeat)
+        avg_chars = sum(len(text) for text in texts) / len(texts)
+        print(f"{name:<14}{len(texts):>7}{avg_chars:>11.0f}{legacy_ms:>11.3f}{engine_ms:>11.3f}{legacy_ms / engine_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import json
+import math
+import os
+import re
+import unicodedata
+import uuid
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from chunk_store import ChunkStore, open_chunk_store
+from index_files import IndexHandle, load_index, read_index_header
+
+BM25_FORMAT_VERSION = 2
+BM25_HEADER = "bm25.json"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Word characters plus the Devanagari block (vowel signs and virama are not \w),
+# minus the danda/double danda, which separate verses
+_TOKEN_RE = re.compile(r"[\w\u0900-\u0963\u0966-\u097f]+")
+_INVISIBLE_RE = re.compile(r"[\u200c\u200d]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; Devanagari words stay whole (ZWJ/ZWNJ dropped)."""
+    text = _INVISIBLE_RE.sub("", unicodedata.normalize("NFC", text)).lower()
+    return _TOKEN_RE.findall(text)
+
+
+def build_bm25_index(index_dir: str, chunks: ChunkStore, generation: int = 0) -> Dict[str, Any]:
+    """Build an inverted index over the chunks in a chunk store and write it to index_dir.
+
+    Postings are stored as flat .npy arrays (doc index and term frequency,
+    grouped by term with an offsets array) so they can be memory-mapped.
+    Files are written under a fresh prefix and published by atomically
+    replacing bm25.json, so readers never see a half-written index.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    term_postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_lens = np.zeros(len(chunks), dtype=np.int32)
+    for doc_index, document in enumerate(chunks.documents):
+        counts = Counter(tokenize(document))
+        doc_lens[doc_index] = sum(counts.values())
+        for term, tf in counts.items():
+            term_postings.setdefault(term, []).append((doc_index, tf))
+
+    terms = sorted(term_postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+        offsets[i + 1] = offsets[i] + len(term_postings[term])
+    postings = np.empty(int(offsets[-1]), dtype=np.int32)
+    tfs = np.empty(int(offsets[-1]), dtype=np.float32)
+    for i, term in enumerate(terms):
+        entries = term_postings[term]
+        postings[offsets[i]:offsets[i + 1]] = [doc for doc, _ in entries]
+        tfs[offsets[i]:offsets[i + 1]] = [tf for _, tf in entries]
+
+    prefix = f"bm25-{uuid.uuid4().hex[:12]}"
+    base = os.path.join(index_dir, prefix)
+    np.save(base + ".postings.npy", postings)
+    np.save(base + ".tfs.npy", tfs)
+    np.save(base + ".offsets.npy", offsets)
+    np.save(base + ".doclens.npy", doc_lens)
+    with open(base + ".terms.json", "w", encoding="utf-8") as fh:
+        json.dump(terms, fh, ensure_ascii=False)
+
+    header = {
+        "version": BM25_FORMAT_VERSION,
+        "prefix": prefix,
+        "generation": generation,
+        "documents": len(chunks),
+        "terms": len(terms),
+        "avg_doc_len": float(doc_lens.mean()) if len(doc_lens) else 0.0,
+        "k1": BM25_K1,
+        "b": BM25_B,
+        # Relative, so the data directory can be moved
+        "chunks": os.path.relpath(chunks.base, index_dir),
+    }
+    tmp_path = os.path.join(index_dir, BM25_HEADER + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(header, fh)
+    os.replace(tmp_path, os.path.join(index_dir, BM25_HEADER))
+
+    # Old generations are unreferenced now (open mmaps keep working on POSIX)
+    for name in os.listdir(index_dir):
+        if name.startswith("bm25-") and not name.startswith(prefix):
+            try:
+                os.remove(os.path.join(index_dir, name))
+            except OSError:
+                pass
+    return header
+
+
+def read_bm25_generation(index_dir: str) -> Optional[int]:
+    """Generation the on-disk index was built for, or None if there is none."""
+    header = read_index_header(index_dir, BM25_HEADER, BM25_FORMAT_VERSION)
+    return header.get("generation") if header else None
+
+
+class BM25Index:
+    """Read-only BM25 index whose postings are memory-mapped from disk."""
+
+    def __init__(self, index_dir: str, header: Dict[str, Any]):
+        base = os.path.join(index_dir, header["prefix"])
+        self.header = header
+        self.generation = header.get("generation")
+        self.k1 = header["k1"]
+        self.b = header["b"]
+        self.avg_doc_len = header["avg_doc_len"] or 1.0
+        self.postings = np.load(base + ".postings.npy", mmap_mode="r")
+        self.tfs = np.load(base + ".tfs.npy", mmap_mode="r")
+        self.offsets = np.load(base + ".offsets.npy", mmap_mode="r")
+        self.doc_lens = np.load(base + ".doclens.npy", mmap_mode="r")
+        with open(base + ".terms.json", "r", encoding="utf-8") as fh:
+            self.term_ids = {term: i for i, term in enumerate(json.load(fh))}
+        # Texts and metadata live in the chunk store shared with the vector index
+        self.chunks = open_chunk_store(os.path.join(index_dir, header["chunks"]))
+        self.ids = self.chunks.ids
+        self.documents = self.chunks.documents
+        self.metadatas = self.chunks.metadatas
+        self.columns = self.chunks.columns
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["BM25Index"]:
+        return load_index(index_dir, BM25_HEADER, BM25_FORMAT_VERSION, cls, "BM25 index")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def filter_mask(
+        self,
+        books: Optional[List[str]] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None,
+    ) -> Optional[np.ndarray]:
+        """Boolean mask of documents in the given books/page range (None = all)."""
+        return self.columns.mask(books, page_from, page_to)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query (0 where no term matches)."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        n_docs = len(self.ids)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            docs = self.postings[start:end]
+            tf = self.tfs[start:end]
+            idf = math.log(1 + (n_docs - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lens[docs] / self.avg_doc_len)
+            # Each doc appears once per term's postings, so plain fancy-index add is safe
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (doc index, score) pairs with a positive score, best first.
+
+        ``mask`` (see filter_mask) restricts the search to matching documents.
+        """
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class BM25IndexHandle(IndexHandle):
+    """Lazily loaded BM25 index, reloaded when a rebuild replaces bm25.json."""
+
+    def __init__(self, index_dir: str):
+        super().__init__(index_dir, BM25_HEADER, BM25Index.load)
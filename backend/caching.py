@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with hit/miss counters.
+
+    Bounded by entry count and, optionally, by total size in bytes (measured
+    with ``sizeof``). Entries can also expire ``ttl_seconds`` after insertion.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds or None
+        self.max_bytes = max_bytes or None
+        self.sizeof = sizeof or (lambda value: len(value))
+        # key -> (value, expires_at, size)
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, size)
+            self.bytes += size
+            while len(self._data) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._data.pop(key)
+        self.bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def stats(self) -> Dict[str, Any]:
+        hit_rate = self.hit_rate
+        stats = {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(hit_rate, 4) if hit_rate is not None else None,
+        }
+        if self.max_bytes:
+            stats.update(bytes=self.bytes, max_bytes=self.max_bytes)
+        if self.ttl_seconds:
+            stats.update(ttl_seconds=self.ttl_seconds, expirations=self.expirations)
+        return stats
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error", "seconds")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.seconds = 0.0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller of ``do(key, fn)`` runs ``fn``; callers arriving with the
+    same key while it runs wait and receive the same value (or exception).
+    Nothing is remembered once the call finishes, so this complements a cache
+    rather than replacing one. Shared values must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.executions = 0
+        self.coalesced = 0
+        # Runtime of the shared executions, once per caller that did not repeat them
+        self.saved_seconds = 0.0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns (value, shared): shared is True when another caller's run was reused."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            with self._lock:
+                self.saved_seconds += flight.seconds
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        started = time.perf_counter()
+        try:
+            flight.value = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            flight.seconds = time.perf_counter() - started
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = self.executions + self.coalesced
+            return {
+                "in_flight": len(self._flights),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "coalesced_rate": round(self.coalesced / calls, 4) if calls else None,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
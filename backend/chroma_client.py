@@ -0,0 +1,79 @@
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import chromadb
+from chromadb.api.client import SharedSystemClient
+from chromadb.config import Settings
+
+
+class CollectionHandle:
+    """Process-wide, lazily opened Chroma collection shared across requests.
+
+    The first get() opens the persistent client and collection; later calls
+    reuse them. chromadb keeps one System (and its in-memory HNSW index) per
+    persist path and hands it back to every new client, so it never notices
+    what another process wrote. With ``generation`` (a callable returning the
+    index generation), get() therefore drops that cached System and reopens
+    from disk whenever the generation has moved since the last open. Safe to
+    use from FastAPI's worker threads.
+    """
+
+    def __init__(
+        self,
+        persist_dir: str,
+        collection_name: str,
+        embedding_function=None,
+        generation: Optional[Callable[[], int]] = None,
+    ):
+        self.persist_dir = persist_dir
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self._generation = generation
+        self._lock = threading.Lock()
+        self._collection = None
+        self._opened_generation: Optional[int] = None
+        self.opens = 0
+        self.reopens = 0
+        self.reuses = 0
+
+    def get(self):
+        generation = self._generation() if self._generation is not None else None
+        collection = self._collection
+        if collection is not None and generation == self._opened_generation:
+            self.reuses += 1
+            return collection
+        with self._lock:
+            if self._collection is None or generation != self._opened_generation:
+                if self._collection is not None:
+                    self.reopens += 1
+                # Otherwise the new client gets the cached System's stale segments back;
+                # callers still holding the old collection keep using the old System
+                SharedSystemClient.clear_system_cache()
+                client = chromadb.PersistentClient(path=self.persist_dir, settings=Settings())
+                kwargs: Dict[str, Any] = {}
+                if self.embedding_function is not None:
+                    kwargs["embedding_function"] = self.embedding_function
+                self._collection = client.get_or_create_collection(self.collection_name, **kwargs)
+                self._opened_generation = generation
+                self.opens += 1
+            else:
+                self.reuses += 1
+            return self._collection
+
+    def close(self) -> None:
+        """Forget the open collection (at shutdown)."""
+        with self._lock:
+            self._collection = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._collection is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "open": self.is_open,
+            "opens": self.opens,
+            "reopens": self.reopens,
+            "reuses": self.reuses,
+            "generation": self._opened_generation,
+        }
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from retrieval import MetadataColumns
+
+CHUNK_STORE_VERSION = 1
+# Chunk stores kept open per process (a rebuild briefly needs the old and the new one)
+_OPEN_STORES_MAX = 2
+
+
+class BlobColumn:
+    """Read-only sequence of strings stored back to back in one memory-mapped file.
+
+    Only the byte offsets are loaded; each item is decoded on access, so
+    every worker shares the text through the OS page cache instead of
+    holding its own copy.
+    """
+
+    def __init__(self, base: str, decode: Optional[Callable[[str], Any]] = None):
+        self.offsets = np.load(base + ".offsets.npy", mmap_mode="r")
+        # np.memmap cannot map an empty file
+        self.blob = np.memmap(base + ".bin", dtype=np.uint8, mode="r") if int(self.offsets[-1]) else b""
+        self._decode = decode
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Any:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        text = bytes(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])]).decode("utf-8")
+        return self._decode(text) if self._decode else text
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class _BlobWriter:
+    def __init__(self, base: str):
+        self.base = base
+        self._fh = open(base + ".bin", "wb")
+        self._offsets = [0]
+
+    def append(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self._fh.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def close(self) -> None:
+        self._fh.close()
+        np.save(self.base + ".offsets.npy", np.asarray(self._offsets, dtype=np.int64))
+
+
+class ChunkStoreWriter:
+    """Stream chunk ids, texts and metadata into a new chunk store under chunk_dir.
+
+    The BM25 and NumPy vector indexes built from the same pass both point
+    at the store (see ChunkStore) instead of each keeping the corpus.
+    """
+
+    def __init__(self, chunk_dir: str):
+        os.makedirs(chunk_dir, exist_ok=True)
+        self.prefix = f"chunks-{uuid.uuid4().hex[:12]}"
+        self.base = os.path.join(chunk_dir, self.prefix)
+        self._ids = _BlobWriter(self.base + ".ids")
+        self._documents = _BlobWriter(self.base + ".documents")
+        self._metadatas = _BlobWriter(self.base + ".metadatas")
+        self._books: Dict[str, int] = {}
+        self._book_codes: List[int] = []
+        self._page_starts: List[int] = []
+        self._page_ends: List[int] = []
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            metadata = metadata or {}
+            self._ids.append(chunk_id)
+            self._documents.append(document)
+            self._metadatas.append(json.dumps(metadata, ensure_ascii=False))
+            book = metadata.get("book_title", "")
+            self._book_codes.append(self._books.setdefault(book, len(self._books)))
+            self._page_starts.append(metadata.get("page_start", metadata.get("page", 0)))
+            self._page_ends.append(metadata.get("page_end", metadata.get("page", 0)))
+
+    def commit(self) -> str:
+        """Finish the files; returns the store's path prefix for index headers."""
+        for writer in (self._ids, self._documents, self._metadatas):
+            writer.close()
+        np.save(self.base + ".books.npy", np.asarray(self._book_codes, dtype=np.int32))
+        np.save(self.base + ".pages.npy", np.asarray([self._page_starts, self._page_ends], dtype=np.int32))
+        with open(self.base + ".json", "w", encoding="utf-8") as fh:
+            json.dump({"version": CHUNK_STORE_VERSION, "count": len(self._book_codes), "books": list(self._books)}, fh)
+        return self.base
+
+
+class ChunkStore:
+    """Chunk ids, texts and metadata of one index build, memory-mapped.
+
+    ``ids``, ``documents`` and ``metadatas`` index like lists; ``columns``
+    holds the book/page filter columns without decoding any metadata.
+    """
+
+    def __init__(self, base: str):
+        with open(base + ".json", "r", encoding="utf-8") as fh:
+            header = json.load(fh)
+        if header.get("version") != CHUNK_STORE_VERSION:
+            raise ValueError(f"Unsupported chunk store version {header.get('version')}")
+        self.base = base
+        self.ids = BlobColumn(base + ".ids")
+        self.documents = BlobColumn(base + ".documents")
+        self.metadatas = BlobColumn(base + ".metadatas", decode=json.loads)
+        books = np.asarray(header["books"], dtype=object)
+        codes = np.load(base + ".books.npy")
+        pages = np.load(base + ".pages.npy")
+        self.columns = MetadataColumns.from_arrays(
+            books[codes] if len(codes) else np.zeros(0, dtype=object), pages[0], pages[1]
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+_open_stores: "OrderedDict[str, ChunkStore]" = OrderedDict()
+_open_stores_lock = threading.Lock()
+
+
+def open_chunk_store(base: str) -> ChunkStore:
+    """Shared ChunkStore for a path prefix, so the BM25 and vector indexes of
+    one build use a single mapping per process."""
+    base = os.path.normpath(base)
+    with _open_stores_lock:
+        store = _open_stores.get(base)
+        if store is None:
+            store = _open_stores[base] = ChunkStore(base)
+            while len(_open_stores) > _OPEN_STORES_MAX:
+                _open_stores.popitem(last=False)
+        else:
+            _open_stores.move_to_end(base)
+        return store
+
+
+def prune_chunk_stores(chunk_dir: str, keep: List[str]) -> None:
+    """Delete chunk stores in chunk_dir other than the ``keep`` path prefixes
+    (open mappings keep working on POSIX)."""
+    keep_prefixes = {os.path.basename(base) for base in keep}
+    for name in os.listdir(chunk_dir):
+        if name.startswith("chunks-") and name.split(".", 1)[0] not in keep_prefixes:
+            try:
+                os.remove(os.path.join(chunk_dir, name))
+            except OSError:
+                pass
@@ -0,0 +1,342 @@
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from redis_support import RedisConnection
+
+# Worker threads per process running compose jobs
+COMPOSE_JOB_WORKERS = int(os.getenv("COMPOSE_JOB_WORKERS", "2"))
+# Seconds a finished job (and its result) stays retrievable
+COMPOSE_JOB_RESULT_TTL = int(os.getenv("COMPOSE_JOB_RESULT_TTL", "3600"))
+# Submissions beyond this many queued jobs are refused
+COMPOSE_JOB_MAX_PENDING = int(os.getenv("COMPOSE_JOB_MAX_PENDING", "100"))
+# Queued and running jobs expire after this long, so a crashed worker's job does not linger
+COMPOSE_JOB_STALE_TTL = int(os.getenv("COMPOSE_JOB_STALE_TTL", "86400"))
+
+FINISHED = ("done", "error")
+_JOB_KEY = "compose:job:"
+_QUEUE_KEY = "compose:queue"
+# How often long polls re-read a job kept in Redis
+_REDIS_POLL_SECONDS = 0.5
+
+
+class MemoryJobStore:
+    """Jobs and queue for one process; the fallback when Redis is absent."""
+
+    def __init__(self, max_pending: int):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._expires: Dict[str, float] = {}
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=max_pending)
+        self._changed = threading.Condition()
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for job_id in [job_id for job_id, at in self._expires.items() if at <= now]:
+            del self._jobs[job_id], self._expires[job_id]
+
+    def save(self, job: Dict[str, Any], ttl: int) -> None:
+        with self._changed:
+            self._purge()
+            self._jobs[job["id"]] = dict(job)
+            self._expires[job["id"]] = time.monotonic() + ttl
+            self._changed.notify_all()
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._changed:
+            self._purge()
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def delete(self, job_id: str) -> None:
+        with self._changed:
+            self._jobs.pop(job_id, None)
+            self._expires.pop(job_id, None)
+
+    def wait_for_change(self, job_id: str, version: int, timeout: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["version"] != version or remaining <= 0:
+                    return dict(job) if job is not None else None
+                self._changed.wait(remaining)
+
+    def enqueue(self, job_id: str) -> bool:
+        try:
+            self._queue.put_nowait(job_id)
+            return True
+        except queue.Full:
+            return False
+
+    def dequeue(self, timeout: float) -> Optional[str]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+
+class RedisJobStore:
+    """Jobs as JSON strings with a TTL and a shared list as the queue, so any
+    uvicorn worker (or host) can run a job and any can report on it."""
+
+    def __init__(self, client: Any, max_pending: int):
+        self.client = client
+        self.max_pending = max_pending
+
+    def save(self, job: Dict[str, Any], ttl: int) -> None:
+        self.client.set(_JOB_KEY + job["id"], json.dumps(job, ensure_ascii=False, separators=(",", ":")), ex=ttl)
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data = self.client.get(_JOB_KEY + job_id)
+        return json.loads(data) if data is not None else None
+
+    def delete(self, job_id: str) -> None:
+        self.client.delete(_JOB_KEY + job_id)
+
+    def wait_for_change(self, job_id: str, version: int, timeout: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.load(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["version"] != version or remaining <= 0:
+                return job
+            time.sleep(min(_REDIS_POLL_SECONDS, remaining))
+
+    def enqueue(self, job_id: str) -> bool:
+        if self.client.llen(_QUEUE_KEY) >= self.max_pending:
+            return False
+        self.client.rpush(_QUEUE_KEY, job_id)
+        return True
+
+    def dequeue(self, timeout: float) -> Optional[str]:
+        item = self.client.blpop([_QUEUE_KEY], timeout=max(1, int(timeout)))
+        if item is None:
+            return None
+        job_id = item[1]
+        return job_id.decode("utf-8") if isinstance(job_id, bytes) else job_id
+
+    def pending(self) -> int:
+        return int(self.client.llen(_QUEUE_KEY))
+
+
+class ComposeJobQueue:
+    """Run compose requests as background jobs identified by an ID.
+
+    ``runner`` is called as ``runner(topic, books, progress)`` on one of
+    ``workers`` daemon threads and returns the JSON-serializable result;
+    ``progress`` accepts keyword updates that pollers see under "progress".
+    Jobs and the queue live in Redis when it is reachable (shared by every
+    process) and in process memory otherwise. A job moves through queued,
+    running, then done or error; finished jobs expire after ``result_ttl``.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[..., Any],
+        redis: Optional[RedisConnection] = None,
+        workers: int = COMPOSE_JOB_WORKERS,
+        result_ttl: int = COMPOSE_JOB_RESULT_TTL,
+        max_pending: int = COMPOSE_JOB_MAX_PENDING,
+    ):
+        self._runner = runner
+        self._redis = redis or RedisConnection()
+        self.workers = max(1, workers)
+        self.result_ttl = result_ttl
+        self.max_pending = max_pending
+        self._memory = MemoryJobStore(max_pending)
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _redis_store(self) -> Optional[RedisJobStore]:
+        client = self._redis.get()
+        return RedisJobStore(client, self.max_pending) if client is not None else None
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        """Persist a job update where the job lives (memory if Redis fails meanwhile)."""
+        job["version"] += 1
+        ttl = self.result_ttl if job["status"] in FINISHED else COMPOSE_JOB_STALE_TTL
+        if job["backend"] == "redis":
+            store = self._redis_store()
+            if store is not None:
+                try:
+                    store.save(job, ttl)
+                    return
+                except Exception as e:
+                    self._redis.mark_down(e)
+            job["backend"] = "memory"
+        self._memory.save(job, ttl)
+
+    def submit(self, topic: str, books: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Queue a compose job; returns the new job, or None when the queue is full."""
+        self._start_workers()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "topic": topic,
+            "books": books,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "progress": {},
+            "result": None,
+            "error": None,
+            "version": 1,
+        }
+        store = self._redis_store()
+        if store is not None:
+            try:
+                job["backend"] = "redis"
+                store.save(job, COMPOSE_JOB_STALE_TTL)
+                queued = store.enqueue(job["id"])
+                if not queued:
+                    store.delete(job["id"])
+                with self._lock:
+                    self.submitted += queued
+                    self.rejected += not queued
+                return job if queued else None
+            except Exception as e:
+                self._redis.mark_down(e)
+        job["backend"] = "memory"
+        # Saved first so a worker never dequeues an id it cannot load
+        self._memory.save(job, COMPOSE_JOB_STALE_TTL)
+        queued = self._memory.enqueue(job["id"])
+        if not queued:
+            self._memory.delete(job["id"])
+        with self._lock:
+            self.submitted += queued
+            self.rejected += not queued
+        return job if queued else None
+
+    def get(self, job_id: str, wait: float = 0, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """The job, or None if unknown or expired.
+
+        With ``wait`` > 0 this long-polls: it returns as soon as the job's
+        version differs from ``version`` (or, when ``version`` is None, as
+        soon as it has finished), or after ``wait`` seconds.
+        """
+        job = self._load(job_id)
+        deadline = time.monotonic() + wait
+        while job is not None and time.monotonic() < deadline:
+            if (job["version"] != version) if version is not None else (job["status"] in FINISHED):
+                break
+            job = self._wait_for_change(job, deadline - time.monotonic())
+        return job
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._memory.load(job_id)
+        if job is not None:
+            return job
+        store = self._redis_store()
+        if store is not None:
+            try:
+                return store.load(job_id)
+            except Exception as e:
+                self._redis.mark_down(e)
+        return None
+
+    def _wait_for_change(self, job: Dict[str, Any], timeout: float) -> Optional[Dict[str, Any]]:
+        if job["backend"] == "redis":
+            store = self._redis_store()
+            if store is not None:
+                try:
+                    return store.wait_for_change(job["id"], job["version"], timeout)
+                except Exception as e:
+                    self._redis.mark_down(e)
+            # The worker falls back to memory too; keep waiting there
+        return self._memory.wait_for_change(job["id"], job["version"], timeout) or self._load(job["id"])
+
+    def _start_workers(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"compose-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        """Next queued job from this process's queue first, then the shared one."""
+        job_id = self._memory.dequeue(timeout=0 if self._redis.get() is not None else 1)
+        if job_id is None:
+            store = self._redis_store()
+            if store is None:
+                return None
+            try:
+                job_id = store.dequeue(timeout=1)
+            except Exception as e:
+                self._redis.mark_down(e)
+                # Block on the local queue instead of spinning on a failing server
+                job_id = self._memory.dequeue(timeout=1)
+        if job_id is None:
+            return None
+        return self._load(job_id)
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            job = self._next_job()
+            if job is None or job["status"] != "queued":
+                continue
+            with self._lock:
+                self._running += 1
+            job.update(status="running", started_at=time.time())
+            self._save(job)
+
+            def progress(**updates: Any) -> None:
+                job["progress"].update(updates)
+                self._save(job)
+
+            try:
+                result = self._runner(job["topic"], job["books"], progress)
+                job.update(status="done", result=result)
+            except Exception as e:
+                traceback.print_exc()
+                job.update(status="error", error=str(e))
+            job["finished_at"] = time.time()
+            self._save(job)
+            with self._lock:
+                self._running -= 1
+                if job["status"] == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def stop(self) -> None:
+        """Let workers exit after their current job (queued jobs stay queued)."""
+        self._stopping.set()
+
+    def stats(self) -> Dict[str, Any]:
+        pending = self._memory.pending()
+        store = self._redis_store()
+        if store is not None:
+            try:
+                pending += store.pending()
+            except Exception as e:
+                self._redis.mark_down(e)
+        with self._lock:
+            return {
+                "backend": "redis" if store is not None else "memory",
+                "workers": self.workers,
+                "running": self._running,
+                "pending": pending,
+                "max_pending": self.max_pending,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "result_ttl": self.result_ttl,
+            }
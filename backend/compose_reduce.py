@@ -0,0 +1,113 @@
+import json
+import os
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, List, Tuple
+
+from bm25_index import tokenize
+
+# Items at least this similar (difflib ratio of normalized text) are duplicates
+COMPOSE_DEDUPE_SIMILARITY = float(os.getenv("COMPOSE_DEDUPE_SIMILARITY", "0.88"))
+# Items kept per section of the draft sent to the final pass
+COMPOSE_SECTION_CAP = int(os.getenv("COMPOSE_SECTION_CAP", "25"))
+
+SECTIONS = ["materials", "steps", "timings", "dos", "donts", "mantras", "notes"]
+# Field compared for object items (CHUNK_PROMPT asks for these shapes)
+_TEXT_FIELDS = {"materials": "name", "mantras": "text"}
+# Leading list markers the model copies from the books ("1.", "Step 3:")
+_MARKER_TOKENS = {"step"}
+
+
+def normalize_item(text: str) -> str:
+    """Comparison key: NFKC, lower-cased word tokens without punctuation or
+    list numbering. Devanagari words stay whole and dandas are dropped
+    (see bm25_index.tokenize), so spacing, ZWJ and compatibility variants of
+    the same mantra compare equal."""
+    tokens = tokenize(unicodedata.normalize("NFKC", text))
+    start = 0
+    while start < len(tokens) and (tokens[start].isdigit() or tokens[start] in _MARKER_TOKENS):
+        start += 1
+    return " ".join(tokens[start:])
+
+
+def item_text(section: str, item: Any) -> str:
+    if isinstance(item, dict):
+        value = item.get(_TEXT_FIELDS.get(section, ""))
+        if value is None:
+            value = " ".join(str(v) for v in item.values() if isinstance(v, str))
+        return str(value)
+    return item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+
+
+def _is_similar(a: str, b: str, threshold: float) -> bool:
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    # The cheap upper bounds rule out most pairs before the full comparison
+    return (
+        matcher.real_quick_ratio() >= threshold
+        and matcher.quick_ratio() >= threshold
+        and matcher.ratio() >= threshold
+    )
+
+
+def dedupe_items(section: str, items: List[Any], threshold: float, cap: int) -> List[Any]:
+    """First occurrence of each item, in order, fuzzy duplicates dropped.
+
+    When a dropped duplicate is an object with fields the kept item lacks
+    (e.g. a material's "why"), those fields are copied over.
+    """
+    kept: List[Any] = []
+    keys: List[str] = []
+    by_key: Dict[str, int] = {}
+    for item in items:
+        key = normalize_item(item_text(section, item))
+        if not key:
+            continue
+        index = by_key.get(key)
+        if index is None:
+            index = next((i for i, other in enumerate(keys) if _is_similar(key, other, threshold)), None)
+        if index is not None:
+            if isinstance(kept[index], dict) and isinstance(item, dict):
+                for field, value in item.items():
+                    if value and not kept[index].get(field):
+                        kept[index][field] = value
+            continue
+        if cap and len(kept) >= cap:
+            continue
+        by_key[key] = len(kept)
+        keys.append(key)
+        kept.append(dict(item) if isinstance(item, dict) else item)
+    return kept
+
+
+def reduce_draft(
+    aggregated: Dict[str, Any],
+    count_tokens: Callable[[str], int],
+    threshold: float = COMPOSE_DEDUPE_SIMILARITY,
+    cap: int = COMPOSE_SECTION_CAP,
+) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """Deduplicate and cap every section of the merged compose draft.
+
+    Returns the reduced draft and stats on items and final-prompt tokens
+    before and after.
+    """
+    reduced: Dict[str, Any] = {}
+    for section in SECTIONS:
+        reduced[section] = dedupe_items(section, aggregated.get(section, []), threshold, cap)
+    seen = set()
+    reduced["sources"] = []
+    for source in aggregated.get("sources", []):
+        marker = (source.get("book"), source.get("page"))
+        if marker not in seen:
+            seen.add(marker)
+            reduced["sources"].append(source)
+
+    tokens_before = count_tokens(json.dumps(aggregated))
+    tokens_after = count_tokens(json.dumps(reduced))
+    stats = {
+        "items_before": sum(len(aggregated.get(section, [])) for section in SECTIONS),
+        "items_after": sum(len(reduced[section]) for section in SECTIONS),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+    }
+    return reduced, stats
@@ -0,0 +1,82 @@
+import os
+import re
+import threading
+import unicodedata
+from typing import List, Optional
+
+from chromadb.utils import embedding_functions
+
+from caching import LRUCache
+from redis_support import RedisConnection
+from tiered_cache import TieredCache, decode_vector, encode_vector
+
+# Distinct normalized queries whose embeddings are kept in memory
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+# Lifetime of query embeddings shared through Redis (when REDIS_URL is set)
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Model behind DefaultEmbeddingFunction; part of the shared cache namespace
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+_embedding_function = None
+_embedding_function_lock = threading.Lock()
+
+
+def get_embedding_function():
+    """Shared instance of the embedding model the collection is indexed with."""
+    global _embedding_function
+    if _embedding_function is None:
+        with _embedding_function_lock:
+            if _embedding_function is None:
+                _embedding_function = embedding_functions.DefaultEmbeddingFunction()
+    return _embedding_function
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a query.
+
+    The default model (all-MiniLM-L6-v2) is uncased and ignores runs of
+    whitespace, so case and spacing variants embed identically.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", query)).strip().lower()
+
+
+class QueryEmbedder:
+    """Embed search queries through a cache of normalized query -> vector.
+
+    The cache is a bounded in-process LRU, backed by Redis when ``redis``
+    is given and reachable so every worker reuses the others' embeddings.
+    """
+
+    def __init__(
+        self, embedding_function=None, max_entries: Optional[int] = None, redis: Optional[RedisConnection] = None
+    ):
+        self._embedding_function = embedding_function
+        self.cache = TieredCache(
+            f"embedding:{EMBEDDING_MODEL_NAME}",
+            LRUCache(max_entries or QUERY_EMBEDDING_CACHE_SIZE),
+            QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+            encode=encode_vector,
+            decode=decode_vector,
+            redis=redis,
+        )
+
+    @property
+    def embedding_function(self):
+        return self._embedding_function or get_embedding_function()
+
+    def embed(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries, running the model once for all cache misses."""
+        keys = [normalize_query(q) for q in queries]
+        vectors = self.cache.get_many(keys)
+        missing = sorted({key for key, vector in zip(keys, vectors) if vector is None})
+        if missing:
+            computed = {
+                key: [float(x) for x in vector]
+                for key, vector in zip(missing, self.embedding_function(missing))
+            }
+            self.cache.put_many(computed)
+            vectors = [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+        return [list(vector) for vector in vectors]
+
+    def stats(self):
+        return self.cache.stats()
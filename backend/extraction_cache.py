@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from embeddings_helper import normalize_query
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Parsed per-chunk compose extractions (safe to delete at any time)
+EXTRACTION_CACHE_PATH = os.getenv(
+    "EXTRACTION_CACHE_PATH", os.path.join(BASE_DIR, "data", "extraction_cache.sqlite3")
+)
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def extraction_cache_key(
+    topic: str, book_sha256: str, chunk: str, model: str, prompt: str, temperature: float
+) -> str:
+    """Key for one chunk extraction.
+
+    ``prompt`` is every fixed instruction sent with the chunk, so editing a
+    prompt template invalidates its entries.
+    """
+    parts = [normalize_query(topic), book_sha256, _sha256(chunk), model, _sha256(prompt), repr(float(temperature))]
+    return _sha256(json.dumps(parts))
+
+
+class ExtractionCache:
+    """Durable key -> JSON cache in SQLite, evicted least-recently-used by size.
+
+    Safe to share between threads and between worker processes (WAL mode).
+    Errors are logged and treated as misses so the cache never fails a request.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT value FROM extractions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE extractions SET last_used = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error as e:
+                print(f"Extraction cache read failed: {e}")
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO extractions (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                        (key, data, size, time.time()),
+                    )
+                    self._evict(conn)
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                print(f"Extraction cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop least recently used entries until the total size fits max_bytes."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM extractions ORDER BY last_used"):
+            if total - freed <= self.max_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        conn.executemany("DELETE FROM extractions WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            try:
+                entries, size = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions"
+                ).fetchone()
+            except sqlite3.Error:
+                entries, size = None, None
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def read_index_header(index_dir: str, filename: str, version: int) -> Optional[Dict[str, Any]]:
+    """The header an index published as ``filename`` in index_dir, or None if it
+    is missing, unreadable or written in another format version."""
+    try:
+        with open(os.path.join(index_dir, filename), "r", encoding="utf-8") as fh:
+            header = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    return header if header.get("version") == version else None
+
+
+def load_index(
+    index_dir: str,
+    filename: str,
+    version: int,
+    factory: Callable[[str, Dict[str, Any]], Any],
+    label: str,
+) -> Any:
+    """``factory(index_dir, header)`` for the published header, or None when
+    there is no usable index (files pruned under a reader are logged)."""
+    header = read_index_header(index_dir, filename, version)
+    if header is None:
+        return None
+    try:
+        return factory(index_dir, header)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"{label} unavailable in {index_dir}: {e}")
+        return None
+
+
+class IndexHandle:
+    """Lazily loaded on-disk index, reloaded when a rebuild replaces its header file.
+
+    ``load(index_dir)`` returns the index or None. Rebuilds publish the header
+    with os.replace, so its inode changes even when the mtime does not.
+    """
+
+    def __init__(self, index_dir: str, filename: str, load: Callable[[str], Any]):
+        self.index_dir = index_dir
+        self.filename = filename
+        self._load = load
+        self._lock = threading.Lock()
+        self._index: Any = None
+        self._stamp: Optional[Tuple[int, int, int]] = None
+
+    def get(self) -> Any:
+        try:
+            st = os.stat(os.path.join(self.index_dir, self.filename))
+        except OSError:
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self._index is not None and stamp == self._stamp:
+            return self._index
+        with self._lock:
+            if self._index is None or stamp != self._stamp:
+                self._index = self._load(self.index_dir)
+                # A failed load (e.g. racing a rebuild) is retried on the next call
+                self._stamp = stamp if self._index is not None else None
+            return self._index
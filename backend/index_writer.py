@@ -0,0 +1,100 @@
+import os
+import time
+from typing import List, Dict, Any, Optional, Callable
+
+# Chunks buffered per collection.add() call during ingestion
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+
+class BatchedIndexWriter:
+    """Buffer chunks and write them to a Chroma collection in large batches.
+
+    Each flush embeds the whole batch at once and persists it with a single
+    collection.add() call instead of one round-trip per chunk. Use it as a
+    context manager so the final partial batch is always flushed.
+    """
+
+    def __init__(
+        self,
+        collection,
+        batch_size: Optional[int] = None,
+        embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        on_flush: Optional[Callable[["BatchedIndexWriter"], None]] = None,
+        on_embeddings: Optional[Callable[[List[str], List[List[float]]], None]] = None,
+    ):
+        self.collection = collection
+        self.batch_size = max(1, batch_size or INGEST_BATCH_SIZE)
+        # When None, Chroma embeds each batch with the collection's own function
+        self.embedding_function = embedding_function
+        # Called after every write, e.g. to publish ingestion progress
+        self.on_flush = on_flush
+        # Receives (ids, embeddings) of each batch embedded here, e.g. to
+        # export them without reading them back from Chroma
+        self.on_embeddings = on_embeddings
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._ids: List[str] = []
+        self.chunks_written = 0
+        self.batches_written = 0
+        self.write_seconds = 0.0
+        self._started = time.perf_counter()
+
+    def __enter__(self) -> "BatchedIndexWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+
+    def add(self, document: str, metadata: Dict[str, Any], chunk_id: str) -> None:
+        """Queue one chunk, flushing when the batch is full."""
+        self._documents.append(document)
+        self._metadatas.append(metadata)
+        self._ids.append(chunk_id)
+        if len(self._ids) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered chunks in one call."""
+        if not self._ids:
+            return
+        started = time.perf_counter()
+        kwargs: Dict[str, Any] = {
+            "documents": self._documents,
+            "metadatas": self._metadatas,
+            "ids": self._ids,
+        }
+        if self.embedding_function is not None:
+            kwargs["embeddings"] = self.embedding_function(self._documents)
+            if self.on_embeddings is not None:
+                self.on_embeddings(self._ids, kwargs["embeddings"])
+        self.collection.add(**kwargs)
+        self.write_seconds += time.perf_counter() - started
+        self.chunks_written += len(self._ids)
+        self.batches_written += 1
+        self._documents, self._metadatas, self._ids = [], [], []
+        if self.on_flush is not None:
+            self.on_flush(self)
+
+    @property
+    def chunks_per_second(self) -> float:
+        """Throughput of the embed + write calls alone."""
+        return self.chunks_written / self.write_seconds if self.write_seconds else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.chunks_written,
+            "batches": self.batches_written,
+            "batch_size": self.batch_size,
+            "write_seconds": round(self.write_seconds, 3),
+            "elapsed_seconds": round(time.perf_counter() - self._started, 3),
+            "chunks_per_second": round(self.chunks_per_second, 1),
+        }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (
+            f"Wrote {stats['chunks']} chunks in {stats['batches']} batches "
+            f"({stats['chunks_per_second']} chunks/s, {stats['write_seconds']}s writing, "
+            f"{stats['elapsed_seconds']}s total)"
+        )
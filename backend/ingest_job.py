@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+
+class IngestJob:
+    """Run ingestion as a single background job and track its progress.
+
+    ``target`` is called as ``target(progress=callback)`` on a daemon thread;
+    the callback accepts keyword updates (books_total, books_done, bytes_total,
+    bytes_done, chunks_embedded, current_book). Only one run happens at a time
+    per process, and ``lock_path`` (a file lock) extends that across uvicorn
+    workers sharing the same data directory.
+    """
+
+    def __init__(self, target: Callable[..., Any], lock_path: Optional[str] = None):
+        self._target = target
+        self._lock_path = lock_path
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {"state": "idle", "runs": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._status["state"] == "running"
+
+    def start(self, reason: str = "manual") -> bool:
+        """Start a run unless one is already in progress; returns True if started."""
+        with self._lock:
+            if self.running:
+                return False
+            self._status = {
+                "state": "running",
+                "reason": reason,
+                "runs": self._status["runs"] + 1,
+                "started_at": time.time(),
+                "finished_at": None,
+                "books_total": 0,
+                "books_done": 0,
+                "bytes_total": 0,
+                "bytes_done": 0,
+                "chunks_embedded": 0,
+                "current_book": None,
+                "error": None,
+                "result": None,
+            }
+            self._thread = threading.Thread(target=self._run, name="ingest-job", daemon=True)
+            self._thread.start()
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot of the job state, with elapsed time and a size-based ETA."""
+        with self._lock:
+            status = dict(self._status)
+        if status.get("started_at"):
+            end = status.get("finished_at") or time.time()
+            status["elapsed_seconds"] = round(end - status["started_at"], 1)
+            status["eta_seconds"] = None
+            if status["state"] == "running" and status["bytes_done"]:
+                remaining = status["bytes_total"] - status["bytes_done"]
+                rate = status["bytes_done"] / status["elapsed_seconds"] if status["elapsed_seconds"] else 0
+                status["eta_seconds"] = round(remaining / rate, 1) if rate else None
+        return status
+
+    def _progress(self, **updates: Any) -> None:
+        with self._lock:
+            self._status.update(updates)
+
+    def _run(self) -> None:
+        lock_file = None
+        try:
+            if self._lock_path and fcntl is not None:
+                os.makedirs(os.path.dirname(self._lock_path), exist_ok=True)
+                lock_file = open(self._lock_path, "w")
+                # Another worker process holding the lock is already ingesting; wait for it
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            result = self._target(progress=self._progress)
+            self._finish("succeeded", result=result)
+        except Exception as e:
+            traceback.print_exc()
+            self._finish("failed", error=str(e))
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def _finish(self, state: str, **fields: Any) -> None:
+        with self._lock:
+            self._status.update(fields, state=state, finished_at=time.time(), current_book=None)
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+from typing import Dict, Any, Optional, List, Tuple
+
+# Bump when the manifest layout changes; older manifests are treated as missing
+MANIFEST_VERSION = 1
+
+# path -> ((inode, mtime_ns, size), generation) so read_generation is a stat() per call
+_generation_memo: Dict[str, Tuple[Tuple[int, int, int], int]] = {}
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Return the hex SHA-256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint_pdf(path: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fingerprint a PDF by size, mtime and content hash.
+
+    The hash is only recomputed when size or mtime differ from the previous
+    fingerprint, so unchanged books cost a single stat() call.
+    """
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        fingerprint["sha256"] = previous.get("sha256")
+    else:
+        fingerprint["sha256"] = file_sha256(path)
+    return fingerprint
+
+
+def empty_manifest() -> Dict[str, Any]:
+    return {"version": MANIFEST_VERSION, "splitter": None, "books": {}, "generation": 0}
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """Load the manifest at path, or an empty one if missing/unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return empty_manifest()
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest()
+    manifest.setdefault("splitter", None)
+    manifest.setdefault("books", {})
+    manifest.setdefault("generation", 0)
+    return manifest
+
+
+def read_generation(path: str) -> int:
+    """Index generation recorded in the manifest (0 if there is none).
+
+    Ingestion bumps it whenever it changes the index, so caches keyed on it
+    are invalidated in every process sharing the data directory. The file is
+    only re-read when it changes: save_manifest replaces it, so the inode
+    differs even when two saves land on the same (coarse) mtime.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0
+    version = (st.st_ino, st.st_mtime_ns, st.st_size)
+    memo = _generation_memo.get(path)
+    if memo is None or memo[0] != version:
+        memo = (version, load_manifest(path)["generation"])
+        _generation_memo[path] = memo
+    return memo[1]
+
+
+def save_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    """Atomically write the manifest so a crash never leaves it half-written."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def plan_ingestion(
+    manifest: Dict[str, Any],
+    fingerprints: Dict[str, Dict[str, Any]],
+    splitter_settings: Dict[str, Any],
+) -> Dict[str, List[str]]:
+    """Compare the manifest with the current PDFs and decide what to do per book.
+
+    Returns a dict with sorted filename lists under "added", "changed",
+    "deleted" and "unchanged". A change in splitter settings invalidates
+    every indexed book.
+    """
+    indexed = manifest.get("books", {})
+    settings_changed = manifest.get("splitter") != splitter_settings
+
+    plan: Dict[str, List[str]] = {"added": [], "changed": [], "deleted": [], "unchanged": []}
+    for filename in sorted(fingerprints):
+        previous = indexed.get(filename)
+        if previous is None:
+            plan["added"].append(filename)
+        elif settings_changed or previous.get("sha256") != fingerprints[filename]["sha256"]:
+            plan["changed"].append(filename)
+        else:
+            plan["unchanged"].append(filename)
+    plan["deleted"] = sorted(name for name in indexed if name not in fingerprints)
+    return plan
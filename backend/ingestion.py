@@ -1,43 +1,46 @@
 import os
-import pdfplumber
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from itertools import groupby
 import chromadb
 from chromadb.config import Settings
 from uuid import uuid4
+from index_writer import BatchedIndexWriter
+from page_chunker import iter_page_chunks
+from text_cache import iter_cached_book_pages
+from structured_extraction import chunk_facts, facts_to_metadata
 
 CHROMA_PERSIST_DIR = "./data/chroma"
 COLLECTION_NAME = "puja_books"
 
-def ingest_pdfs(pdf_dir: str):
+def ingest_pdfs(pdf_dir: str, batch_size: int = None):
     client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR, settings=Settings())
     collection = client.get_or_create_collection(COLLECTION_NAME)
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-
-    total_chunks = 0
-    for filename in os.listdir(pdf_dir):
-        if not filename.endswith(".pdf"):
-            continue
-        path = os.path.join(pdf_dir, filename)
-        print(f"Processing {path}...")
-        with pdfplumber.open(path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text() or ""
-            chunks = splitter.split_text(text)
-            for i, chunk in enumerate(chunks):
-                collection.add(
-                    documents=[chunk],
-                    metadatas=[{
+    paths = [os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.endswith(".pdf")]
+    with BatchedIndexWriter(collection, batch_size=batch_size) as writer:
+        for path, book_pages in groupby(iter_cached_book_pages(paths), key=lambda page: page[0]):
+            print(f"Processing {path}...")
+            filename = os.path.basename(path)
+            chunks = iter_page_chunks(
+                ((page_number, text) for _, page_number, text in book_pages),
+                chunk_size=1000,
+                chunk_overlap=200,
+            )
+            for i, (chunk, page_start, page_end) in enumerate(chunks):
+                writer.add(
+                    chunk,
+                    {
                         "book_title": filename,
-                        "page": i,
-                        "chunk_id": str(uuid4())
-                    }],
-                    ids=[str(uuid4())]
+                        "page": page_start,
+                        "page_start": page_start,
+                        "page_end": page_end,
+                        "chunk_index": i,
+                        "chunk_id": str(uuid4()),
+                        "structured_facts": facts_to_metadata(chunk_facts(chunk)),
+                    },
+                    str(uuid4()),
                 )
-            total_chunks += len(chunks)
 
-    print(f"Ingestion complete. Total chunks: {total_chunks}")
+    print(f"Ingestion complete. {writer.report()}")
 
 if __name__ == "__main__":
     ingest_pdfs("./pdfs")
@@ -0,0 +1,71 @@
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+
+def _chunk_offsets(text: str, chunks: List[str]) -> List[int]:
+    """Locate each split chunk in the text it came from (chunks are in order)."""
+    offsets = []
+    search_from = 0
+    for chunk in chunks:
+        found = text.find(chunk, search_from)
+        if found < 0:
+            found = search_from
+        offsets.append(found)
+        search_from = found + 1
+    return offsets
+
+
+def iter_page_chunks(
+    pages: Iterable[Tuple[int, str]],
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    window_chars: int = 0,
+) -> Iterator[Tuple[str, int, int]]:
+    """Chunk a stream of (page_number, text) pages incrementally.
+
+    Yields (chunk, page_start, page_end) where the page span is the real PDF
+    page range the chunk was cut from. Pages are buffered only until the
+    buffer reaches ``window_chars`` (default: 8 chunks' worth); every chunk but
+    the last is then emitted and the buffer restarts at the last chunk, which
+    carries the overlap into the next window.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    window_chars = window_chars or chunk_size * 8
+
+    buffer = ""
+    # (offset in buffer, page number) for each page that starts in the buffer
+    page_offsets: List[int] = []
+    page_numbers: List[int] = []
+
+    def page_at(offset: int) -> int:
+        return page_numbers[max(0, bisect_right(page_offsets, offset) - 1)]
+
+    def spans(chunks: List[str]) -> Iterator[Tuple[str, int, int]]:
+        for chunk, start in zip(chunks, _chunk_offsets(buffer, chunks)):
+            yield chunk, page_at(start), page_at(start + len(chunk) - 1)
+
+    for page_number, text in pages:
+        if not text:
+            continue
+        page_offsets.append(len(buffer))
+        page_numbers.append(page_number)
+        buffer += text + "\n"
+        if len(buffer) < window_chars:
+            continue
+
+        chunks = splitter.split_text(buffer)
+        if len(chunks) < 2:
+            continue
+        keep_from = _chunk_offsets(buffer, chunks)[-1]
+        yield from spans(chunks[:-1])
+
+        # Restart the window at the last (possibly incomplete) chunk
+        first_kept = max(0, bisect_right(page_offsets, keep_from) - 1)
+        page_offsets = [0] + [offset - keep_from for offset in page_offsets[first_kept + 1:]]
+        page_numbers = page_numbers[first_kept:]
+        buffer = buffer[keep_from:]
+
+    if buffer:
+        yield from spans(splitter.split_text(buffer))
@@ -0,0 +1,138 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Tuple, Optional, Iterator, Set
+
+import pdfplumber
+
+# Worker processes used for PDF parsing (1 disables the pool)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Pages handed to a worker at a time; large books are split into several ranges
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Page ranges in flight at once; bounds how many parsed pages sit in memory
+PDF_PREFETCH_TASKS = int(os.getenv("PDF_PREFETCH_TASKS", "0")) or 2 * PDF_EXTRACT_WORKERS
+
+
+def count_pages(pdf_path: str) -> int:
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) of a PDF ("" for pages without text)."""
+    with pdfplumber.open(pdf_path) as pdf:
+        return [(page.extract_text() or "") for page in pdf.pages[start:end]]
+
+
+def _plan_tasks(pdf_paths: List[str], pages_per_task: int) -> Tuple[Dict[str, int], List[Tuple[str, int, int]]]:
+    """Split every book into page ranges; books that cannot be opened get no tasks."""
+    page_counts: Dict[str, int] = {}
+    tasks: List[Tuple[str, int, int]] = []
+    for path in pdf_paths:
+        try:
+            page_counts[path] = count_pages(path)
+        except Exception as e:
+            print(f"Error extracting text from {path}: {e}")
+            continue
+        for start in range(0, page_counts[path], pages_per_task):
+            tasks.append((path, start, min(start + pages_per_task, page_counts[path])))
+    return page_counts, tasks
+
+
+def iter_book_pages(
+    pdf_paths: List[str],
+    workers: Optional[int] = None,
+    pages_per_task: Optional[int] = None,
+    failed: Optional[Set[str]] = None,
+) -> Iterator[Tuple[str, int, str]]:
+    """Yield (path, page_number, text) for every page, in book then page order.
+
+    Page numbers are 1-based and pages without text yield "". Page ranges of
+    all books are parsed on a process pool, but only a bounded window of ranges
+    is in flight, so memory stays proportional to that window rather than to
+    the corpus. Paths whose extraction fails are added to ``failed`` and the
+    rest of that book is skipped; that includes a book whose pages kill the
+    worker process, after which the pool is restarted for the other books.
+    """
+    workers = workers or PDF_EXTRACT_WORKERS
+    pages_per_task = max(1, pages_per_task or PDF_PAGES_PER_TASK)
+    failed = failed if failed is not None else set()
+    page_counts, tasks = _plan_tasks(pdf_paths, pages_per_task)
+    failed.update(path for path in pdf_paths if path not in page_counts)
+
+    if workers <= 1 or len(tasks) <= 1:
+        for path, start, end in tasks:
+            if path in failed:
+                continue
+            try:
+                texts = extract_page_range(path, start, end)
+            except Exception as e:
+                print(f"Error extracting text from {path}: {e}")
+                failed.add(path)
+                continue
+            for offset, text in enumerate(texts):
+                yield path, start + offset + 1, text
+        return
+
+    # spawn keeps workers independent of the server's threads and open handles
+    context = multiprocessing.get_context("spawn")
+    workers = min(workers, len(tasks))
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    remaining = deque(tasks)
+    # Ranges that were in flight when a worker died; re-run one at a time
+    # so a PDF that crashes the parser fails alone instead of its neighbours
+    retry: deque = deque()
+    pending: deque = deque()
+    window = max(workers, PDF_PREFETCH_TASKS)
+    try:
+        while True:
+            while True:
+                # While re-running lost ranges, only one is in flight at a time
+                isolating = bool(retry) or any(alone for _, alone, _ in pending)
+                source = retry if retry else remaining
+                if not source or len(pending) >= (1 if isolating else window):
+                    break
+                task = source.popleft()
+                if task[0] in failed:
+                    continue
+                try:
+                    pending.append((task, source is retry, pool.submit(extract_page_range, *task)))
+                except BrokenProcessPool:
+                    source.appendleft(task)
+                    if pending:
+                        # The ranges in flight report the broken pool below
+                        break
+                    # An idle worker died; nothing was lost, so just replace the pool
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            if not pending:
+                break
+            task, alone, future = pending.popleft()
+            path, start, _ = task
+            try:
+                texts = future.result()
+            except BrokenProcessPool as e:
+                # A worker died (out of memory, a crash inside the parser); every
+                # range in flight is lost with it, so start a fresh pool
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+                if alone:
+                    print(f"Error extracting text from {path}: worker process died ({e})")
+                    failed.add(path)
+                else:
+                    retry.extend([task] + [lost for lost, _, _ in pending])
+                pending.clear()
+                continue
+            except Exception as e:
+                if path not in failed:
+                    print(f"Error extracting text from {path}: {e}")
+                failed.add(path)
+                continue
+            if path in failed:
+                continue
+            for offset, text in enumerate(texts):
+                yield path, start + offset + 1, text
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
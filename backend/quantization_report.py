@@ -0,0 +1,135 @@
+"""Recall-vs-memory report for the int8 quantized vector index.
+
+Compares quantized search (coarse int8 top-k, float16 re-rank) at several
+re-rank factors with Chroma vector search and with exact float16 search over
+the same matrix, and measures how much of what search_books returns today
+(hybrid BM25 + vector as configured) each option keeps when search_books runs
+on it. Run from backend/ after ingestion has built data/vectors:
+
+    python quantization_report.py --k 5 --factors 1,2,4,8 --sample 200
+"""
+import argparse
+import random
+import time
+from typing import List, Dict, Any
+
+import numpy as np
+
+import api
+import vector_store
+
+PRESET_QUERIES = [
+    "Sai Baba puja",
+    "Lakshmi puja",
+    "Durga puja",
+    "Shiva puja",
+    "Chandi puja",
+]
+
+
+def recall(reference: List[List[str]], candidate: List[List[str]]) -> float:
+    """Mean fraction of each reference top-k that the candidate also returned."""
+    scores = [len(set(ref) & set(cand)) / len(ref) for ref, cand in zip(reference, candidate) if ref]
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def timed_ids(search, query_embeddings, k: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    indices, _ = search(query_embeddings, k)
+    elapsed = time.perf_counter() - started
+    return {"indices": indices, "ms_per_query": 1000 * elapsed / max(1, len(query_embeddings))}
+
+
+def search_books_ids(chunk_ids: Dict[Any, str], queries: List[str], k: int) -> Dict[str, Any]:
+    """Chunk ids of search_books_batch results (which carry book and text, not ids)."""
+    started = time.perf_counter()
+    results = api.search_books_batch(queries, k)
+    elapsed = time.perf_counter() - started
+    ids = [[chunk_ids.get((hit["book"], hit["content"])) for hit in hits] for hits in results]
+    return {"ids": ids, "ms_per_query": 1000 * elapsed / max(1, len(queries))}
+
+
+def search_books_with(chunk_ids: Dict[Any, str], queries: List[str], k: int, backend: str,
+                      quantized: bool = False, factor: int = 1) -> Dict[str, Any]:
+    """search_books_batch with its vector leg switched to the given backend."""
+    saved = api.VECTOR_BACKEND, vector_store.VECTOR_QUANTIZED, vector_store.VECTOR_RERANK_FACTOR
+    api.VECTOR_BACKEND, vector_store.VECTOR_QUANTIZED, vector_store.VECTOR_RERANK_FACTOR = backend, quantized, factor
+    try:
+        return search_books_ids(chunk_ids, queries, k)
+    finally:
+        api.VECTOR_BACKEND, vector_store.VECTOR_QUANTIZED, vector_store.VECTOR_RERANK_FACTOR = saved
+
+
+def build_queries(index, sample: int, seed: int) -> List[str]:
+    """Preset queries plus the opening words of randomly sampled chunks."""
+    queries = list(PRESET_QUERIES)
+    rng = random.Random(seed)
+    for i in rng.sample(range(len(index)), min(sample, len(index))):
+        words = index.documents[i].split()
+        if words:
+            queries.append(" ".join(words[:12]))
+    return queries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--factors", default="1,2,4,8", help="Comma-separated re-rank factors")
+    parser.add_argument("--sample", type=int, default=100, help="Chunk-derived queries to add to the presets")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    index = api.vector_index_handle.get()
+    if index is None or not len(index):
+        raise SystemExit(f"No vector index in {api.VECTOR_INDEX_DIR}; run ingestion first")
+
+    queries = build_queries(index, args.sample, args.seed)
+    query_embeddings = np.asarray(api.query_embedder.embed(queries), dtype=np.float32)
+
+    # 1) What search_books returns today, as configured (the reference for tuning)
+    chunk_ids = {(book, text): chunk_id for chunk_id, text, book in zip(index.ids, index.documents, index.columns.books)}
+    search_books_ids_now = search_books_ids(chunk_ids, queries, args.k)["ids"]
+
+    # 2) The Chroma vector leg on its own
+    saved_backend, api.VECTOR_BACKEND = api.VECTOR_BACKEND, "chroma"
+    started = time.perf_counter()
+    chroma_ids = [[hit["id"] for hit in hits] for hits in api._vector_search_many(queries, args.k)]
+    chroma_ms = 1000 * (time.perf_counter() - started) / len(queries)
+    api.VECTOR_BACKEND = saved_backend
+
+    # 3) Exact float16 search over the same matrix isolates quantization error
+    exact = timed_ids(index.nearest, query_embeddings, args.k)
+    exact_ids = [[index.ids[i] for i in row] for row in exact["indices"].tolist()]
+    books_chroma = search_books_with(chunk_ids, queries, args.k, "chroma")
+    books_exact = search_books_with(chunk_ids, queries, args.k, "numpy")
+
+    memory = index.memory_footprint()
+    print(f"Chunks: {len(index)}  dim: {index.header.get('dim')}  queries: {len(queries)}  k: {args.k}")
+    print("Matrix memory: " + "  ".join(f"{name}={size / 2**20:.2f} MiB" for name, size in memory.items()))
+    print()
+    print(f"Vector legs alone (recall@k), and search_books run on each one (recall@k vs search_books "
+          f"as configured: RETRIEVAL_MODE={api.RETRIEVAL_MODE}, VECTOR_BACKEND={api.VECTOR_BACKEND})")
+    header = (f"{'vector search':<18}{'resident MiB':>14}{'vs chroma vector':>18}{'vs exact':>10}{'ms/query':>10}"
+              f"{'search_books recall':>21}{'ms/query':>10}")
+    print(header)
+    print("-" * len(header))
+    print(f"{'chroma vector':<18}{'-':>14}{1.0:>18.3f}{recall(exact_ids, chroma_ids):>10.3f}{chroma_ms:>10.2f}"
+          f"{recall(search_books_ids_now, books_chroma['ids']):>21.3f}{books_chroma['ms_per_query']:>10.2f}")
+    print(f"{'float16 exact':<18}{memory['float16'] / 2**20:>14.2f}"
+          f"{recall(chroma_ids, exact_ids):>18.3f}{1.0:>10.3f}{exact['ms_per_query']:>10.2f}"
+          f"{recall(search_books_ids_now, books_exact['ids']):>21.3f}{books_exact['ms_per_query']:>10.2f}")
+
+    for factor in [int(f) for f in args.factors.split(",") if f.strip()]:
+        result = timed_ids(
+            lambda q, k: index.nearest_quantized(q, k, rerank_factor=factor), query_embeddings, args.k
+        )
+        ids = [[index.ids[i] for i in row] for row in result["indices"].tolist()]
+        books = search_books_with(chunk_ids, queries, args.k, "numpy", quantized=True, factor=factor)
+        # Re-ranking reads k * factor float16 rows per query from disk; the int8 matrix stays resident
+        print(f"{f'int8 rerank x{factor}':<18}{memory['int8'] / 2**20:>14.2f}"
+              f"{recall(chroma_ids, ids):>18.3f}{recall(exact_ids, ids):>10.3f}{result['ms_per_query']:>10.2f}"
+              f"{recall(search_books_ids_now, books['ids']):>21.3f}{books['ms_per_query']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+from typing import Any, Optional
+
+# e.g. redis://localhost:6379/0; unset means every Redis-backed feature runs in-process
+REDIS_URL = os.getenv("REDIS_URL")
+# After a failed connection attempt, wait this long before trying again
+REDIS_RETRY_SECONDS = float(os.getenv("REDIS_RETRY_SECONDS", "30"))
+
+
+class RedisConnection:
+    """Lazily connected, shared Redis client that degrades to None.
+
+    get() returns a client that answered PING, or None when REDIS_URL is
+    unset, the redis package is missing or the server is unreachable (retried
+    at most every REDIS_RETRY_SECONDS). Callers that hit an error mid-request
+    call mark_down() and fall back to their in-process path.
+    """
+
+    def __init__(self, url: Optional[str] = REDIS_URL, client: Any = None):
+        self.url = url
+        self._client = client
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+
+    def get(self) -> Any:
+        if self._client is not None:
+            return self._client
+        if not self.url or time.monotonic() < self._retry_at:
+            return None
+        with self._lock:
+            if self._client is None and time.monotonic() >= self._retry_at:
+                try:
+                    import redis
+                    client = redis.Redis.from_url(self.url, socket_timeout=2, socket_connect_timeout=2)
+                    client.ping()
+                    self._client = client
+                    print(f"Connected to Redis at {self.url}")
+                except Exception as e:
+                    print(f"Redis unavailable at {self.url} ({e}); using in-process fallbacks")
+                    self._retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+        return self._client
+
+    def mark_down(self, error: Exception) -> None:
+        """Drop the client after an error; the next get() reconnects after the retry delay."""
+        if not self.url:
+            # An injected client has no URL to reconnect with; keep using it
+            return
+        with self._lock:
+            if self._client is not None:
+                print(f"Redis error ({error}); using in-process fallbacks for {REDIS_RETRY_SECONDS:.0f}s")
+            self._client = None
+            self._retry_at = time.monotonic() + REDIS_RETRY_SECONDS
@@ -0,0 +1,134 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional
+
+import numpy as np
+
+# Standard RRF damping constant (Cormack et al.); larger values flatten rank differences
+RRF_K = 60
+
+_DEVANAGARI_RE = re.compile(r"[\u0900-\u097f]")
+
+
+def is_exact_term_query(query: str) -> bool:
+    """Queries the embedding model cannot help with: quoted phrases or Devanagari.
+
+    The default embedding model is English-only, so mantras in Devanagari are
+    matched far better (and more cheaply) by the lexical index alone.
+    """
+    stripped = query.strip()
+    quoted = len(stripped) > 2 and stripped[0] == stripped[-1] == '"'
+    return quoted or bool(_DEVANAGARI_RE.search(query))
+
+
+def chroma_where(
+    books: Optional[List[str]] = None,
+    page_from: Optional[int] = None,
+    page_to: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """Metadata filter restricting a Chroma query to books and a page range.
+
+    A chunk matches the page range when its [page_start, page_end] span
+    overlaps [page_from, page_to]; either bound may be omitted.
+    """
+    clauses: List[Dict[str, Any]] = []
+    if books:
+        clauses.append({"book_title": {"$in": list(books)}})
+    if page_from is not None:
+        clauses.append({"page_end": {"$gte": page_from}})
+    if page_to is not None:
+        clauses.append({"page_start": {"$lte": page_to}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class MetadataColumns:
+    """Columnar view of chunk metadata for vectorised book/page filtering."""
+
+    def __init__(self, metadatas: List[Dict[str, Any]]):
+        self.books = np.array([m.get("book_title", "") for m in metadatas], dtype=object)
+        self.page_starts = np.array([m.get("page_start", m.get("page", 0)) for m in metadatas], dtype=np.int32)
+        self.page_ends = np.array([m.get("page_end", m.get("page", 0)) for m in metadatas], dtype=np.int32)
+
+    @classmethod
+    def from_arrays(cls, books: np.ndarray, page_starts: np.ndarray, page_ends: np.ndarray) -> "MetadataColumns":
+        """Columns that were stored as arrays (see chunk_store.py)."""
+        columns = cls([])
+        columns.books = books
+        columns.page_starts = np.asarray(page_starts, dtype=np.int32)
+        columns.page_ends = np.asarray(page_ends, dtype=np.int32)
+        return columns
+
+    def mask(
+        self,
+        books: Optional[List[str]] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None,
+    ) -> Optional[np.ndarray]:
+        """Boolean mask of chunks in the given books/page range (None = all),
+        with the same semantics as chroma_where."""
+        if not books and page_from is None and page_to is None:
+            return None
+        mask = np.ones(len(self.books), dtype=bool)
+        if books:
+            mask &= np.isin(self.books, list(books))
+        if page_from is not None:
+            mask &= self.page_ends >= page_from
+        if page_to is not None:
+            mask &= self.page_starts <= page_to
+        return mask
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Fuse several ranked id lists into one, best first.
+
+    Each id scores sum(1 / (k + rank)) over the lists it appears in. The
+    returned "score" is normalised by the best achievable score, so it lies
+    in (0, 1] no matter how many rankings were fused.
+    """
+    scores: Dict[str, float] = {}
+    first_seen: Dict[str, int] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+            first_seen.setdefault(doc_id, len(first_seen))
+    best = len(rankings) / (k + 1) if rankings else 1.0
+    ordered = sorted(scores, key=lambda doc_id: (-scores[doc_id], first_seen[doc_id]))
+    return [{"id": doc_id, "score": scores[doc_id] / best} for doc_id in ordered]
+
+
+class StageTimings:
+    """Running per-stage latency totals for the search path."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._stages.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {
+                    "count": int(s["count"]),
+                    "avg_ms": round(1000 * s["total"] / s["count"], 3),
+                    "max_ms": round(1000 * s["max"], 3),
+                }
+                for name, s in self._stages.items()
+            }
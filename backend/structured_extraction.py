@@ -0,0 +1,200 @@
+import json
+import os
+import re
+from typing import Any, List, Dict, Iterable, Iterator, Optional, Tuple
+
+# Optional cap on a single match's length; 0 keeps the historical unbounded matches
+STRUCTURED_MAX_MATCH_CHARS = int(os.getenv("STRUCTURED_MAX_MATCH_CHARS", "0"))
+
+STEP_LIMIT_PER_PATTERN = 5
+# Cap on merged timings and mantras per answer (steps are capped per pattern)
+STRUCTURED_MAX_ITEMS = int(os.getenv("STRUCTURED_MAX_ITEMS", "20"))
+
+# Bump whenever PATTERNS, MATERIAL_KEYWORDS or the facts layout change; it is
+# part of the ingest splitter settings, so a bump re-ingests every book
+FACTS_VERSION = 1
+
+# (category, name, prefix, terminator). Every historical pattern has the shape
+# ``prefix[^T]*T``, so a match is the prefix plus everything up to the next
+# terminator; the old regexes are kept in the comments for reference.
+PATTERNS: List[Tuple[str, str, str, str]] = [
+    ("steps", "numbered", r"\d+\.", "."),          # (\d+\.\s*[^.]*\.)
+    ("steps", "step_n", r"step(?=\s*\d)", "."),    # (step\s*\d+[^.]*\.)
+    ("steps", "first", r"first", "."),
+    ("steps", "second", r"second", "."),
+    ("steps", "third", r"third", "."),
+    ("steps", "then", r"then", "."),
+    ("steps", "next", r"next", "."),
+    ("steps", "after", r"after", "."),
+    ("timings", "morning", r"morning", "."),
+    ("timings", "evening", r"evening", "."),
+    ("timings", "sunrise", r"sunrise", "."),
+    ("timings", "sunset", r"sunset", "."),
+    ("timings", "brahma_muhurta", r"brahma muhurta", "."),
+    ("timings", "amavasya", r"amavasya", "."),
+    ("timings", "purnima", r"purnima", "."),
+    ("mantras", "om_symbol", "\u0950", "\u0964"),  # om sign up to the danda
+    ("mantras", "om", r"om", "."),
+    ("mantras", "namah", r"namah", "."),
+    ("mantras", "swaha", r"swaha", "."),
+]
+
+MATERIAL_KEYWORDS = [
+    "incense", "flowers", "coconut", "banana", "ghee", "kumkum", "chandan",
+    "kalash", "diya", "camphor", "sweets", "fruits", "rice", "water",
+    "mango leaves", "tulsi", "betel leaves", "betel nuts"
+]
+
+# One alternation finds every prefix. No two prefixes can start at the same
+# position, but one can start inside another ("thenext"), so each search
+# resumes one character after the previous prefix started.
+#
+# re.IGNORECASE and capture groups both make sre try every branch at every
+# position. The fast path scans the lower-cased text with a group-free
+# pattern, which is equivalent whenever lower() maps characters one-to-one
+# (after folding long s and dotless i, which re.IGNORECASE equates with s and
+# i), and maps the matched prefix back to its pattern by value.
+_PREFIX_RE = re.compile("|".join(prefix for _, _, prefix, _ in PATTERNS))
+_PREFIX_INDEX = {re.sub(r"\(.*\)", "", prefix): i for i, (_, _, prefix, _) in enumerate(PATTERNS) if i}
+_PREFIX_RE_IGNORECASE = re.compile(
+    "|".join(f"(?P<p{i}>{prefix})" for i, (_, _, prefix, _) in enumerate(PATTERNS)), re.IGNORECASE
+)
+_CASE_FOLD_FIXES = str.maketrans({"\u017f": "s", "\u0131": "i"})
+
+
+def _iter_prefixes(text: str, lowered: str) -> Iterator[Tuple[int, int, int, str]]:
+    """(pattern index, start, prefix end, scanned text) for every prefix in text.
+
+    Positions in the scanned text are positions in text.
+    """
+    if len(lowered) != len(text):
+        scanned, prefix_re = text, _PREFIX_RE_IGNORECASE
+    else:
+        if "\u017f" in lowered or "\u0131" in lowered:
+            lowered = lowered.translate(_CASE_FOLD_FIXES)
+        scanned, prefix_re = lowered, _PREFIX_RE
+    search = prefix_re.search
+    found = search(scanned)
+    while found is not None:
+        if found.lastgroup:
+            i = int(found.lastgroup[1:])
+        else:
+            # Only the numbered pattern's prefix (digits and a period) is not a literal
+            i = _PREFIX_INDEX.get(found.group(), 0)
+        yield i, found.start(), found.end(), scanned
+        found = search(scanned, found.start() + 1)
+
+
+def find_pattern_matches(
+    text: str, max_match_chars: Optional[int] = None, lowered: Optional[str] = None
+) -> List[List[str]]:
+    """Stripped matches of every pattern in PATTERNS, from one scan of text.
+
+    Equivalent to ``re.findall(prefix + "[^T]*T", text, re.IGNORECASE)`` per
+    pattern: a pattern's next match may not start before its previous match
+    ended. Match ends come from str.find on the terminator, so text without
+    periods costs one failed find per pattern instead of a backtracking scan
+    per occurrence. ``lowered`` is text.lower(), if the caller has it.
+    """
+    max_match_chars = STRUCTURED_MAX_MATCH_CHARS if max_match_chars is None else max_match_chars
+    matches: List[List[str]] = [[] for _ in PATTERNS]
+    # Per pattern: where its next match may start (len(text) + 1 once no terminator is left)
+    resume = [0] * len(PATTERNS)
+    for i, start, prefix_end, scanned in _iter_prefixes(text, text.lower() if lowered is None else lowered):
+        if start < resume[i]:
+            continue
+        end = scanned.find(PATTERNS[i][3], prefix_end)
+        if end < 0:
+            resume[i] = len(text) + 1
+            continue
+        if max_match_chars and end + 1 - start > max_match_chars:
+            continue
+        matches[i].append(text[start:end + 1].strip())
+        resume[i] = end + 1
+    return matches
+
+
+def find_materials(text: str, lowered: Optional[str] = None) -> List[str]:
+    """MATERIAL_KEYWORDS (in list order) that occur in text, case-insensitively."""
+    # Each membership test is a C-level substring search over one lower() copy
+    lowered = text.lower() if lowered is None else lowered
+    return [keyword for keyword in MATERIAL_KEYWORDS if keyword in lowered]
+
+
+def extract_structured_fields(text: str, max_match_chars: Optional[int] = None) -> Dict[str, List]:
+    """Steps, materials, timings and mantras for create_structured_response."""
+    lowered = text.lower()
+    steps: List[str] = []
+    timings: List[str] = []
+    mantras: List[str] = []
+    for (category, _, _, _), found in zip(PATTERNS, find_pattern_matches(text, max_match_chars, lowered)):
+        if category == "steps":
+            steps.extend(found[:STEP_LIMIT_PER_PATTERN])
+        elif category == "timings":
+            timings.extend(found)
+        else:
+            mantras.extend(found)
+    return {
+        "steps": steps,
+        "materials": find_materials(text, lowered),
+        "timings": timings,
+        "mantras": mantras,
+    }
+
+
+def chunk_facts(text: str) -> Dict[str, Any]:
+    """Per-pattern matches and materials of one chunk, as stored at ingest."""
+    lowered = text.lower()
+    matches = find_pattern_matches(text, lowered=lowered)
+    return {
+        "version": FACTS_VERSION,
+        "matches": {name: found for (_, name, _, _), found in zip(PATTERNS, matches) if found},
+        "materials": find_materials(text, lowered),
+    }
+
+
+def facts_to_metadata(facts: Dict[str, Any]) -> str:
+    """Compact JSON string (Chroma metadata values must be scalars)."""
+    return json.dumps(facts, ensure_ascii=False, separators=(",", ":"))
+
+
+def facts_from_metadata(value: Any) -> Optional[Dict[str, Any]]:
+    """Stored facts, or None if missing, unreadable or from another FACTS_VERSION."""
+    if not value:
+        return None
+    try:
+        facts = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(facts, dict) or facts.get("version") != FACTS_VERSION:
+        return None
+    return facts
+
+
+def merge_chunk_facts(facts_list: Iterable[Dict[str, Any]], max_items: Optional[int] = None) -> Dict[str, List]:
+    """Merge per-chunk facts (best hit first) into extract_structured_fields' shape.
+
+    Matches keep pattern order, then hit order; duplicates (common between
+    overlapping chunks) are dropped, steps are capped per pattern and
+    timings/mantras at ``max_items``.
+    """
+    max_items = STRUCTURED_MAX_ITEMS if max_items is None else max_items
+    facts_list = list(facts_list)
+    fields: Dict[str, List] = {"steps": [], "materials": [], "timings": [], "mantras": []}
+    seen = set()
+    for category, name, _, _ in PATTERNS:
+        bucket = fields[category]
+        # Steps are capped per pattern, timings and mantras per category
+        limit = len(bucket) + STEP_LIMIT_PER_PATTERN if category == "steps" else max_items
+        for facts in facts_list:
+            for match in facts["matches"].get(name, ()):
+                if limit and len(bucket) >= limit:
+                    break
+                if (category, match) not in seen:
+                    seen.add((category, match))
+                    bucket.append(match)
+    found = set()
+    for facts in facts_list:
+        found.update(facts["materials"])
+    fields["materials"] = [keyword for keyword in MATERIAL_KEYWORDS if keyword in found]
+    return fields
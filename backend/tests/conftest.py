@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The backend modules use flat imports (they run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,139 @@
+import pytest
+
+from caching import LRUCache
+from redis_support import RedisConnection
+from tiered_cache import TieredCache, decode_text, decode_vector, encode_text, encode_vector
+
+
+class FakeRedis:
+    """The subset of the redis-py client TieredCache uses, kept in a dict."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.fail = False
+
+    def _check(self):
+        if self.fail:
+            raise ConnectionError("redis is down")
+
+    def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    def mget(self, keys):
+        self._check()
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        self._check()
+        self.data[key] = value
+        self.ttls[key] = ex
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value, ex))
+
+    def execute(self):
+        self.client._check()
+        for key, value, ex in self.commands:
+            self.client.set(key, value, ex=ex)
+
+
+def make_cache(client, namespace="ask", ttl=60, url=None, **codecs):
+    return TieredCache(namespace, LRUCache(16), ttl, redis=RedisConnection(url=url, client=client), **codecs)
+
+
+def test_l2_hit_is_copied_into_l1():
+    client = FakeRedis()
+    make_cache(client).put(("lakshmi puja", 5), "answer")
+
+    # A second worker: empty L1, same Redis
+    cache = make_cache(client)
+    assert cache.get(("lakshmi puja", 5)) == "answer"
+    assert cache.l2_hits == 1
+    assert ("lakshmi puja", 5) in cache.l1
+
+    client.fail = True
+    assert cache.get(("lakshmi puja", 5)) == "answer"
+    assert cache.l2_errors == 0
+
+
+def test_get_many_fetches_only_l1_misses():
+    client = FakeRedis()
+    writer = make_cache(client)
+    writer.put_many({"a": "1", "b": "2"})
+    cache = make_cache(client)
+    cache.l1.put("a", "local")
+    assert cache.get_many(["a", "b", "c"]) == ["local", "2", None]
+    assert (cache.l2_hits, cache.l2_misses) == (1, 1)
+
+
+def test_keys_are_namespaced_and_expire():
+    client = FakeRedis()
+    ask = make_cache(client, namespace="ask", ttl=120)
+    compose = make_cache(client, namespace="compose", ttl=None)
+    ask.put("topic", "from ask")
+    compose.put("topic", "from compose")
+
+    assert ask.redis_key("topic") != compose.redis_key("topic")
+    assert ask.redis_key("topic").startswith("cache:v1:ask:")
+    assert client.ttls[ask.redis_key("topic")] == 120
+    assert client.ttls[compose.redis_key("topic")] is None
+    assert make_cache(client, namespace="compose").get("topic") == "from compose"
+
+
+@pytest.mark.parametrize("text", ["", "short", "ॐ श्री गणेशाय नमः " * 100])
+def test_text_codec_round_trips(text):
+    blob = encode_text(text)
+    assert blob[:1] == (b"z" if len(text.encode("utf-8")) >= 512 else b"t")
+    assert decode_text(blob) == text
+
+
+def test_vector_codec_round_trips_float32():
+    vector = [0.0, 1.5, -0.25, 3.0e-5]
+    blob = encode_vector(vector)
+    assert blob[:1] == b"f" and len(blob) == 1 + 4 * len(vector)
+    assert decode_vector(blob) == pytest.approx(vector, rel=1e-6)
+
+
+def test_vector_cache_round_trips_through_redis():
+    client = FakeRedis()
+    kwargs = dict(encode=encode_vector, decode=decode_vector)
+    make_cache(client, namespace="embedding:test", **kwargs).put("om", [0.5, -1.0])
+    assert make_cache(client, namespace="embedding:test", **kwargs).get("om") == [0.5, -1.0]
+
+
+def test_undecodable_entry_is_a_miss():
+    client = FakeRedis()
+    cache = make_cache(client)
+    client.data[cache.redis_key("k")] = b"?garbage"
+    assert cache.get("k") is None
+    assert cache.l2_misses == 1
+
+
+def test_falls_back_to_l1_after_mark_down():
+    client = FakeRedis()
+    cache = make_cache(client, url="redis://example:6379/0")
+    cache.put("before", "v1")
+
+    client.fail = True
+    cache.put("during", "v2")
+    assert cache.l2_errors == 1
+    # The connection is marked down, so later calls skip Redis entirely
+    assert cache._client() is None
+    assert cache.get("during") == "v2"
+    assert cache.get("missing") is None
+    assert cache.l2_errors == 1
+    assert cache.stats()["l2"]["backend"] is None
+
+    client.fail = False
+    assert cache.redis_key("during") not in client.data
@@ -0,0 +1,151 @@
+import gzip
+import json
+import os
+import unicodedata
+from typing import List, Dict, Tuple, Optional, Iterator, Set, Iterable
+
+from ingest_manifest import fingerprint_pdf
+from pdf_extraction import iter_book_pages
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Extracted page text, keyed by PDF content hash (safe to delete at any time)
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", os.path.join(BASE_DIR, "data", "text_cache"))
+# Part of every cache file name; bump when extraction or normalization changes
+TEXT_CACHE_VERSION = 1
+
+# path -> last fingerprint, so repeat lookups only stat() unchanged files
+_fingerprints: Dict[str, Dict] = {}
+
+
+def content_hash(pdf_path: str) -> str:
+    """SHA-256 of a PDF, re-hashed only when its size or mtime changes."""
+    fingerprint = fingerprint_pdf(pdf_path, _fingerprints.get(pdf_path))
+    _fingerprints[pdf_path] = fingerprint
+    return fingerprint["sha256"]
+
+
+def normalize_page(text: str) -> str:
+    """Canonical form stored in the cache (NFC keeps Devanagari comparable)."""
+    return unicodedata.normalize("NFC", text)
+
+
+def cache_path(sha256: str) -> str:
+    return os.path.join(TEXT_CACHE_DIR, f"{sha256}.v{TEXT_CACHE_VERSION}.jsonl.gz")
+
+
+def _read_pages(path: str) -> Iterator[str]:
+    # One JSON string per line, gzip-compressed; read lazily page by page
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            yield json.loads(line)
+
+
+class _PageWriter:
+    """Stream one book's pages into a temp file, published only when complete."""
+
+    def __init__(self, sha256: str):
+        os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+        self.path = cache_path(sha256)
+        self.tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        self._fh = gzip.open(self.tmp_path, "wt", encoding="utf-8", compresslevel=6)
+
+    def write(self, text: str) -> None:
+        self._fh.write(json.dumps(text, ensure_ascii=False) + "\n")
+
+    def finish(self, ok: bool) -> None:
+        """Publish the entry if the book extracted cleanly, else throw it away."""
+        if ok:
+            self._fh.close()
+            os.replace(self.tmp_path, self.path)
+        else:
+            self.discard()
+
+    def discard(self) -> None:
+        self._fh.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def iter_cached_book_pages(
+    pdf_paths: List[str],
+    hashes: Optional[Dict[str, str]] = None,
+    failed: Optional[Set[str]] = None,
+) -> Iterator[Tuple[str, int, str]]:
+    """Drop-in replacement for iter_book_pages that reads through the text cache.
+
+    Cached books are streamed from disk first, then cache misses are parsed
+    on the process pool and written to the cache as they stream past. Pass
+    ``hashes`` (path -> sha256) when they are already known.
+    """
+    failed = failed if failed is not None else set()
+    hashes = dict(hashes or {})
+    for path in pdf_paths:
+        if not hashes.get(path):
+            try:
+                hashes[path] = content_hash(path)
+            except OSError as e:
+                print(f"Error extracting text from {path}: {e}")
+                failed.add(path)
+
+    hits = [p for p in pdf_paths if p not in failed and os.path.exists(cache_path(hashes[p]))]
+    misses = [p for p in pdf_paths if p not in failed and p not in hits]
+
+    for path in hits:
+        try:
+            for page_number, text in enumerate(_read_pages(cache_path(hashes[path])), start=1):
+                yield path, page_number, text
+        except (OSError, ValueError, EOFError) as e:
+            # Corrupt entry: drop it so the next run re-parses the book
+            print(f"Discarding unreadable text cache for {path}: {e}")
+            failed.add(path)
+            try:
+                os.remove(cache_path(hashes[path]))
+            except OSError:
+                pass
+
+    if not misses:
+        return
+    writer: Optional[_PageWriter] = None
+    current: Optional[str] = None
+    try:
+        for path, page_number, text in iter_book_pages(misses, failed=failed):
+            if path != current:
+                if writer is not None:
+                    writer.finish(ok=current not in failed)
+                writer, current = _PageWriter(hashes[path]), path
+            text = normalize_page(text)
+            writer.write(text)
+            yield path, page_number, text
+        if writer is not None:
+            writer.finish(ok=current not in failed)
+            writer = None
+    finally:
+        if writer is not None:
+            writer.discard()
+
+
+def read_book_pages(pdf_paths: List[str]) -> Dict[str, List[str]]:
+    """Page texts for several PDFs (path -> pages); failed books map to []."""
+    pages: Dict[str, List[str]] = {path: [] for path in pdf_paths}
+    failed: Set[str] = set()
+    for path, _, text in iter_cached_book_pages(pdf_paths, failed=failed):
+        pages[path].append(text)
+    for path in failed:
+        pages[path] = []
+    return pages
+
+
+def prune(keep_hashes: Iterable[str]) -> int:
+    """Delete cache entries for PDFs that no longer exist; returns how many."""
+    keep = {cache_path(sha) for sha in keep_hashes}
+    removed = 0
+    if not os.path.isdir(TEXT_CACHE_DIR):
+        return removed
+    for name in os.listdir(TEXT_CACHE_DIR):
+        path = os.path.join(TEXT_CACHE_DIR, name)
+        if path not in keep and name.endswith(".jsonl.gz"):
+            os.remove(path)
+            removed += 1
+    return removed
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+
+from caching import LRUCache
+from redis_support import RedisConnection
+
+# Values at least this large are zlib-compressed in Redis
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "512"))
+# Bump when a codec changes so old Redis entries are ignored
+_KEY_PREFIX = "cache:v1:"
+
+
+def encode_text(value: str) -> bytes:
+    data = value.encode("utf-8")
+    if len(data) >= CACHE_COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(data, 6)
+    return b"t" + data
+
+
+def decode_text(blob: bytes) -> str:
+    if blob[:1] == b"z":
+        return zlib.decompress(blob[1:]).decode("utf-8")
+    if blob[:1] == b"t":
+        return blob[1:].decode("utf-8")
+    raise ValueError("unknown text encoding")
+
+
+def encode_vector(vector: List[float]) -> bytes:
+    # Embedding models output float32, so this is lossless (and ~5x smaller than JSON)
+    return b"f" + np.asarray(vector, dtype="<f4").tobytes()
+
+
+def decode_vector(blob: bytes) -> List[float]:
+    if blob[:1] != b"f":
+        raise ValueError("unknown vector encoding")
+    return np.frombuffer(blob[1:], dtype="<f4").tolist()
+
+
+class TieredCache:
+    """Two-level cache: an in-process LRUCache (L1) over Redis (L2).
+
+    Reads try L1, then Redis, copying Redis hits into L1; writes go to both.
+    Redis entries are shared by every uvicorn worker, stored under
+    ``cache:v1:<namespace>:<key digest>`` with ``encode``/``decode`` and
+    expire after ``ttl_seconds``. Without a reachable Redis (no REDIS_URL,
+    server down, errors mid-request) the cache keeps working on L1 alone.
+    Keys must be JSON-serializable (tuples of str/int/None).
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        l1: LRUCache,
+        ttl_seconds: Optional[float],
+        encode: Callable[[Any], bytes] = encode_text,
+        decode: Callable[[bytes], Any] = decode_text,
+        redis: Optional[RedisConnection] = None,
+    ):
+        self.namespace = namespace
+        self.l1 = l1
+        self.ttl_seconds = int(ttl_seconds) if ttl_seconds else None
+        self._encode = encode
+        self._decode = decode
+        self._redis = redis
+        self._lock = threading.Lock()
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_writes = 0
+        self.l2_errors = 0
+
+    def redis_key(self, key: Hashable) -> str:
+        digest = hashlib.sha1(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return f"{_KEY_PREFIX}{self.namespace}:{digest}"
+
+    def _client(self) -> Any:
+        return self._redis.get() if self._redis is not None else None
+
+    def _failed(self, error: Exception) -> None:
+        with self._lock:
+            self.l2_errors += 1
+        self._redis.mark_down(error)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self.get_many([key], default)[0]
+
+    def get_many(self, keys: List[Hashable], default: Any = None) -> List[Any]:
+        """Values for keys (``default`` for misses), with one Redis round trip for all L1 misses."""
+        values = [self.l1.get(key, default) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is default]
+        client = self._client() if missing else None
+        if client is None:
+            return values
+        try:
+            blobs = client.mget([self.redis_key(keys[i]) for i in missing])
+        except Exception as e:
+            self._failed(e)
+            return values
+        hits = 0
+        for i, blob in zip(missing, blobs):
+            if blob is None:
+                continue
+            try:
+                value = self._decode(blob)
+            except Exception as e:
+                print(f"Dropping undecodable {self.namespace} cache entry: {e}")
+                continue
+            self.l1.put(keys[i], value)
+            values[i] = value
+            hits += 1
+        with self._lock:
+            self.l2_hits += hits
+            self.l2_misses += len(missing) - hits
+        return values
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self.put_many({key: value})
+
+    def put_many(self, items: Dict[Hashable, Any]) -> None:
+        for key, value in items.items():
+            self.l1.put(key, value)
+        client = self._client()
+        if client is None or not items:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(self.redis_key(key), self._encode(value), ex=self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            self._failed(e)
+            return
+        with self._lock:
+            self.l2_writes += len(items)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.l1.stats()
+        connected = self._client() is not None
+        with self._lock:
+            lookups = self.l2_hits + self.l2_misses
+            stats["l2"] = {
+                "backend": "redis" if connected else None,
+                "hits": self.l2_hits,
+                "misses": self.l2_misses,
+                "writes": self.l2_writes,
+                "errors": self.l2_errors,
+                "hit_rate": round(self.l2_hits / lookups, 4) if lookups else None,
+                "ttl_seconds": self.ttl_seconds,
+            }
+        return stats
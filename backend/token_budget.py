@@ -0,0 +1,80 @@
+import os
+import threading
+from typing import Any, Callable, Dict, List
+
+# Prompt tokens per compose extraction request (instructions included)
+COMPOSE_TOKEN_BUDGET = int(os.getenv("COMPOSE_TOKEN_BUDGET", "6000"))
+# Used when tiktoken cannot load an encoding (it downloads BPE files on first use)
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+_encodings: Dict[str, Any] = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(model: str):
+    """tiktoken encoding for model, or None if tiktoken or its data is unavailable.
+
+    The lookup (including a failed one) is remembered for the process.
+    """
+    if model in _encodings:
+        return _encodings[model]
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"tiktoken unavailable for {model} ({e}); estimating {CHARS_PER_TOKEN_ESTIMATE} chars per token")
+                encoding = None
+            _encodings[model] = encoding
+    return _encodings[model]
+
+
+def token_counter(model: str) -> Callable[[str], int]:
+    """Function counting the tokens of a text for model (estimated without tiktoken)."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return lambda text: -(-len(text) // CHARS_PER_TOKEN_ESTIMATE)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def excerpt_marker(excerpt: Dict[str, Any]) -> str:
+    return f"[Source: {excerpt['book']}, page {excerpt['page']}]"
+
+
+def format_excerpts(excerpts: List[Dict[str, Any]]) -> str:
+    """Excerpts joined for one request, each preceded by its source marker."""
+    return "\n\n".join(f"{excerpt_marker(excerpt)}\n{excerpt['chunk']}" for excerpt in excerpts)
+
+
+def pack_excerpts(
+    excerpts: List[Dict[str, Any]],
+    budget: int,
+    count_tokens: Callable[[str], int],
+    overhead_tokens: int = 0,
+) -> List[List[Dict[str, Any]]]:
+    """Group excerpts (most relevant first) into packs that fit ``budget`` tokens.
+
+    Packs are filled in order, so each pack holds consecutive excerpts and
+    the most relevant ones go out first. ``overhead_tokens`` is what every
+    request spends besides the excerpts (instructions, topic, source list).
+    An excerpt too large for an empty pack is sent on its own.
+    """
+    room = max(1, budget - overhead_tokens)
+    packs: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    used = 0
+    for excerpt in excerpts:
+        # +2 for the blank line between excerpts
+        size = count_tokens(excerpt_marker(excerpt)) + count_tokens(excerpt["chunk"]) + 2
+        if current and used + size > room:
+            packs.append(current)
+            current, used = [], 0
+        current.append(excerpt)
+        used += size
+    if current:
+        packs.append(current)
+    return packs
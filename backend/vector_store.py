@@ -0,0 +1,271 @@
+import json
+import os
+import uuid
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from chunk_store import open_chunk_store
+from index_files import IndexHandle, load_index, read_index_header
+
+VECTOR_FORMAT_VERSION = 3
+VECTOR_HEADER = "vectors.json"
+# Rows scored per step; bounds the float32 scratch space of a search
+VECTOR_SEARCH_BLOCK_ROWS = int(os.getenv("VECTOR_SEARCH_BLOCK_ROWS", "8192"))
+# Search the int8 copy first, then re-rank the best k * factor rows at full precision
+VECTOR_QUANTIZED = os.getenv("VECTOR_QUANTIZED", "0") == "1"
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+
+
+def quantize_rows(rows: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """Symmetric int8 quantization with a per-dimension scale (x ~= q * scale)."""
+    return np.clip(np.rint(rows / scale), -127, 127).astype(np.int8)
+
+
+class VectorIndexBuilder:
+    """Write chunk embeddings to a float16 .npy file that readers memory-map.
+
+    Rows are appended in batches (so the corpus never has to fit in memory as
+    Python lists), in the order of the chunk store they index. commit() also
+    writes an int8 copy with per-dimension scales for quantized search, then
+    publishes the index by atomically replacing vectors.json.
+    """
+
+    def __init__(self, index_dir: str, capacity: int, generation: int = 0):
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.capacity = capacity
+        self.generation = generation
+        self.prefix = f"vectors-{uuid.uuid4().hex[:12]}"
+        self.base = os.path.join(index_dir, self.prefix)
+        self.count = 0
+        self._vectors = None
+        self._sq_norms = None
+
+    def add(self, embeddings) -> None:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(embeddings):
+            return
+        if self._vectors is None:
+            self._vectors = np.lib.format.open_memmap(
+                self.base + ".vectors.npy", mode="w+", dtype=np.float16,
+                shape=(max(self.capacity, len(embeddings)), embeddings.shape[1]),
+            )
+            self._sq_norms = np.zeros(self._vectors.shape[0], dtype=np.float32)
+        end = self.count + len(embeddings)
+        if end > self._vectors.shape[0]:
+            raise ValueError(f"Vector index capacity {self._vectors.shape[0]} exceeded")
+        stored = embeddings.astype(np.float16)
+        self._vectors[self.count:end] = stored
+        # Norms of the stored (float16) rows, so distances are self-consistent
+        self._sq_norms[self.count:end] = np.einsum("ij,ij->i", stored.astype(np.float32), stored.astype(np.float32))
+        self.count = end
+
+    def _write_quantized(self) -> None:
+        """Two blockwise passes: per-dimension max |x|, then quantize."""
+        rows = self._vectors[: self.count]
+        max_abs = np.zeros(rows.shape[1], dtype=np.float32)
+        for start in range(0, self.count, VECTOR_SEARCH_BLOCK_ROWS):
+            block = np.abs(np.asarray(rows[start:start + VECTOR_SEARCH_BLOCK_ROWS], dtype=np.float32))
+            np.maximum(max_abs, block.max(axis=0), out=max_abs)
+        scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        quantized = np.lib.format.open_memmap(
+            self.base + ".int8.npy", mode="w+", dtype=np.int8, shape=(max(self.count, 1), rows.shape[1])
+        )
+        for start in range(0, self.count, VECTOR_SEARCH_BLOCK_ROWS):
+            block = np.asarray(rows[start:start + VECTOR_SEARCH_BLOCK_ROWS], dtype=np.float32)
+            quantized[start:start + len(block)] = quantize_rows(block, scale)
+        quantized.flush()
+        del quantized
+        np.save(self.base + ".scale.npy", scale)
+
+    def commit(self, chunks_base: str) -> Dict[str, Any]:
+        """Publish the index; ``chunks_base`` is the chunk store its rows follow."""
+        dim = 0
+        if self._vectors is not None:
+            dim = int(self._vectors.shape[1])
+            self._vectors.flush()
+            self._write_quantized()
+            del self._vectors
+            self._vectors = None
+            np.save(self.base + ".sqnorms.npy", self._sq_norms)
+        header = {
+            "version": VECTOR_FORMAT_VERSION,
+            "prefix": self.prefix,
+            "generation": self.generation,
+            "count": self.count,
+            "dim": dim,
+            # Relative, so the data directory can be moved
+            "chunks": os.path.relpath(chunks_base, self.index_dir),
+        }
+        tmp_path = os.path.join(self.index_dir, VECTOR_HEADER + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(header, fh)
+        os.replace(tmp_path, os.path.join(self.index_dir, VECTOR_HEADER))
+
+        for name in os.listdir(self.index_dir):
+            if name.startswith("vectors-") and not name.startswith(self.prefix):
+                try:
+                    os.remove(os.path.join(self.index_dir, name))
+                except OSError:
+                    pass
+        return header
+
+
+def read_vector_generation(index_dir: str) -> Optional[int]:
+    """Generation the on-disk vector index was built for, or None if there is none."""
+    header = read_index_header(index_dir, VECTOR_HEADER, VECTOR_FORMAT_VERSION)
+    return header.get("generation") if header else None
+
+
+class NumpyVectorIndex:
+    """Exact nearest-neighbour search over a memory-mapped float16 matrix.
+
+    The matrix is opened read-only with mmap, so every worker process shares
+    the same pages through the OS page cache. Distances are squared L2, like
+    Chroma's default space, and hits have the same shape as the Chroma path.
+    """
+
+    def __init__(self, index_dir: str, header: Dict[str, Any]):
+        base = os.path.join(index_dir, header["prefix"])
+        self.header = header
+        self.generation = header.get("generation")
+        self.count = header["count"]
+        if self.count:
+            self.vectors = np.load(base + ".vectors.npy", mmap_mode="r")[: self.count]
+            self.sq_norms = np.load(base + ".sqnorms.npy", mmap_mode="r")[: self.count]
+            self.quantized = np.load(base + ".int8.npy", mmap_mode="r")[: self.count]
+            self.scale = np.load(base + ".scale.npy")
+        else:
+            self.vectors = np.zeros((0, 0), dtype=np.float16)
+            self.sq_norms = np.zeros(0, dtype=np.float32)
+            self.quantized = np.zeros((0, 0), dtype=np.int8)
+            self.scale = np.ones(0, dtype=np.float32)
+        # Texts and metadata live in the chunk store shared with the BM25 index
+        self.chunks = open_chunk_store(os.path.join(index_dir, header["chunks"]))
+        self.ids = self.chunks.ids
+        self.documents = self.chunks.documents
+        self.metadatas = self.chunks.metadatas
+        self.columns = self.chunks.columns
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["NumpyVectorIndex"]:
+        return load_index(index_dir, VECTOR_HEADER, VECTOR_FORMAT_VERSION, cls, "Vector index")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def filter_mask(
+        self,
+        books: Optional[List[str]] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None,
+    ) -> Optional[np.ndarray]:
+        return self.columns.mask(books, page_from, page_to)
+
+    def nearest(self, query_embeddings, k: int, mask: Optional[np.ndarray] = None, quantized: bool = False):
+        """Batched exact top-k: returns (indices, distances), each (queries, <=k), nearest first.
+
+        Rows are scored in blocks of VECTOR_SEARCH_BLOCK_ROWS; each block keeps
+        its own top-k via argpartition and the survivors are merged at the end.
+        With ``quantized`` the blocks come from the int8 matrix instead (see
+        nearest_quantized); only exact re-ranking touches the float16 rows.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        allowed = self.count if mask is None else int(mask.sum())
+        k = min(k, allowed)
+        if k <= 0 or not self.count:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        q_sq = np.einsum("ij,ij->i", queries, queries)[:, None]
+        cand_idx, cand_dist = [], []
+        # int8 rows dot (q * scale) == dequantized rows dot q
+        scaled_queries = queries * self.scale[None, :] if quantized else queries
+        source = self.quantized if quantized else self.vectors
+        for start in range(0, self.count, VECTOR_SEARCH_BLOCK_ROWS):
+            end = min(start + VECTOR_SEARCH_BLOCK_ROWS, self.count)
+            block = np.asarray(source[start:end], dtype=np.float32)
+            dist = q_sq + self.sq_norms[start:end][None, :] - 2.0 * (scaled_queries @ block.T)
+            if mask is not None:
+                dist[:, ~mask[start:end]] = np.inf
+            kb = min(k, end - start)
+            part = np.argpartition(dist, kb - 1, axis=1)[:, :kb]
+            cand_idx.append(part + start)
+            cand_dist.append(np.take_along_axis(dist, part, axis=1))
+
+        idx = np.concatenate(cand_idx, axis=1)
+        dist = np.concatenate(cand_dist, axis=1)
+        top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        idx = np.take_along_axis(idx, top, axis=1)
+        dist = np.take_along_axis(dist, top, axis=1)
+        order = np.argsort(dist, axis=1, kind="stable")
+        return np.take_along_axis(idx, order, axis=1), np.maximum(np.take_along_axis(dist, order, axis=1), 0.0)
+
+    def nearest_quantized(
+        self, query_embeddings, k: int, mask: Optional[np.ndarray] = None, rerank_factor: Optional[int] = None
+    ):
+        """Approximate top-k: coarse int8 search for k * rerank_factor candidates,
+        then exact distances from the float16 rows of those candidates only."""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        candidates, _ = self.nearest(queries, k * max(1, rerank_factor or VECTOR_RERANK_FACTOR), mask, quantized=True)
+        if not candidates.shape[1]:
+            return candidates, candidates.astype(np.float32)
+        k = min(k, candidates.shape[1])
+        out_idx = np.empty((len(queries), k), dtype=np.int64)
+        out_dist = np.empty((len(queries), k), dtype=np.float32)
+        for row, (query, cand) in enumerate(zip(queries, candidates)):
+            # Sorted indices keep the memmap reads sequential
+            cand = np.sort(cand)
+            exact = np.asarray(self.vectors[cand], dtype=np.float32)
+            dist = float(query @ query) + self.sq_norms[cand] - 2.0 * (exact @ query)
+            order = np.argsort(dist, kind="stable")[:k]
+            out_idx[row] = cand[order]
+            out_dist[row] = np.maximum(dist[order], 0.0)
+        return out_idx, out_dist
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Bytes each representation of the matrix occupies (float32 is hypothetical)."""
+        rows, dim = self.count, int(self.header.get("dim") or 0)
+        return {
+            "float32": rows * dim * 4,
+            "float16": rows * dim * 2,
+            "int8": rows * dim + dim * 4,
+        }
+
+    def search_many(
+        self, query_embeddings, k: int, mask: Optional[np.ndarray] = None, quantized: Optional[bool] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Hits per query as {"id", "content", "metadata", "score"} (score = 1 - distance).
+
+        ``quantized`` defaults to VECTOR_QUANTIZED.
+        """
+        quantized = VECTOR_QUANTIZED if quantized is None else quantized
+        if quantized:
+            indices, distances = self.nearest_quantized(query_embeddings, k, mask)
+        else:
+            indices, distances = self.nearest(query_embeddings, k, mask)
+        return [
+            [
+                {
+                    "id": self.ids[i],
+                    "content": self.documents[i],
+                    "metadata": self.metadatas[i],
+                    "score": 1 - float(d),
+                }
+                for i, d in zip(row_idx, row_dist)
+                if np.isfinite(d)
+            ]
+            for row_idx, row_dist in zip(indices.tolist(), distances.tolist())
+        ]
+
+
+class NumpyVectorIndexHandle(IndexHandle):
+    """Lazily loaded vector index, reloaded when a rebuild replaces vectors.json."""
+
+    def __init__(self, index_dir: str):
+        super().__init__(index_dir, VECTOR_HEADER, NumpyVectorIndex.load)